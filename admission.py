@@ -0,0 +1,278 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from flask import Response, current_app, jsonify, request
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+class Rejected(Exception):
+    """A request turned away before its handler ran."""
+
+    def __init__(self, status, message, retry_after):
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+# Token buckets
+#
+# take(key, rate, burst) spends one token of the bucket ``key``, which
+# holds up to ``burst`` tokens and refills ``rate`` per second. It returns
+# 0 when a token was spent, else the seconds until one is available.
+
+class MemoryBuckets:
+    """Per-process buckets, the default; the least recently used are
+    dropped past ``maxsize`` keys."""
+
+    def __init__(self, maxsize=10000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = self.clock()
+        with self._lock:
+            tokens, at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - at) * rate)
+            wait = 0.0
+            if tokens < 1:
+                wait = (1 - tokens) / rate
+            else:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or burst
+local at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - at) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+else
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Buckets shared by every gunicorn worker, updated atomically by a
+    script running on the redis server."""
+
+    def __init__(self, client, prefix='capstone:bucket:'):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def take(self, key, rate, burst):
+        return float(self._take(keys=[self.prefix + key],
+                                args=[rate, burst]))
+
+
+def make_buckets(kind, url=None, size=10000):
+    """RedisBuckets for the ``'redis'`` backend, else MemoryBuckets."""
+    if kind == 'redis':
+        return RedisBuckets.from_url(url)
+    return MemoryBuckets(size)
+
+
+# Concurrency
+
+class Gate:
+    """Lets at most ``limit`` requests of a route class run at once.
+
+    Up to ``queue_depth`` more wait, each at most ``timeout`` seconds, for
+    one to finish; past that requests are rejected right away. Slots are
+    counted per worker process.
+    """
+
+    def __init__(self, limit, queue_depth=16, timeout=2.0):
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def enter(self):
+        """Take a slot. Returns False when one was free, True when the
+        request queued for it and None when it is rejected."""
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return False
+            if self.waiting >= self.queue_depth:
+                return None
+            self.waiting += 1
+            try:
+                free = self._cond.wait_for(
+                    lambda: self.active < self.limit, self.timeout)
+            finally:
+                self.waiting -= 1
+            if not free:
+                return None
+            self.active += 1
+            return True
+
+    def leave(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+class AdmissionControl:
+    """Rate limits callers and caps concurrency per route class.
+
+    Each (sub, permission) pair gets a token bucket, ``rates`` maps a
+    permission to its own ``(rate, burst)``. Routes are 'heavy' when their
+    endpoint is in ``heavy``, otherwise 'write' or 'light' by method; every
+    class with a limit in ``concurrency`` gets a Gate.
+    """
+
+    def __init__(self, buckets, rate=20, burst=40, rates=None,
+                 concurrency=None, heavy=(), queue_depth=16,
+                 queue_timeout=2.0, retry_after=1):
+        self.buckets = buckets
+        self.rate = rate
+        self.burst = burst
+        self.rates = rates or {}
+        self.heavy = set(heavy)
+        self.retry_after = retry_after
+        self.gates = {
+            name: Gate(limit, queue_depth, queue_timeout)
+            for name, limit in (concurrency or {}).items()}
+
+    def route_class(self):
+        if request.endpoint in self.heavy:
+            return 'heavy'
+        if request.method not in READ_METHODS:
+            return 'write'
+        return 'light'
+
+    @contextmanager
+    def admit(self, payload, permission):
+        """Run the body of the ``with`` as an admitted request or raise
+        Rejected.
+
+        The ``with`` yields a function the body passes its response
+        through: a streamed response keeps its slot until it is closed,
+        not just until the handler returns.
+        """
+        route_class = self.route_class()
+        rate, burst = self.rates.get(permission, (self.rate, self.burst))
+        key = '%s:%s' % (payload.get('sub'), permission or '*')
+        wait = self.buckets.take(key, rate, burst)
+        if wait:
+            _count('admission_rejected_total', route_class, 'rate')
+            raise Rejected(429, 'Too many requests', math.ceil(wait))
+        gate = self.gates.get(route_class)
+        if gate is None:
+            yield _unheld
+            return
+        queued = gate.enter()
+        if queued is None:
+            _count('admission_rejected_total', route_class, 'overload')
+            raise Rejected(503, 'Server busy, try again later',
+                           self.retry_after)
+        if queued:
+            _count('admission_queued_total', route_class)
+        held = []
+
+        def hold(response):
+            if isinstance(response, Response) and response.is_streamed:
+                # the server closes the response when the stream ends or
+                # the client goes away
+                response.call_on_close(gate.leave)
+                held.append(response)
+            return response
+        try:
+            yield hold
+        finally:
+            if not held:
+                gate.leave()
+
+    def gauges(self):
+        """(name, value) pairs of the current in-flight and queued
+        requests, for /metrics."""
+        pairs = []
+        for name, gate in sorted(self.gates.items()):
+            pairs.append(('admission_active{class="%s"}' % name,
+                          gate.active))
+            pairs.append(('admission_waiting{class="%s"}' % name,
+                          gate.waiting))
+        return pairs
+
+
+def _unheld(response):
+    return response
+
+
+def _count(name, route_class, reason=None):
+    metrics = current_app.extensions.get('metrics')
+    if metrics is None:
+        return
+    labels = [('class', route_class)]
+    if reason is not None:
+        labels.append(('reason', reason))
+    metrics.inc(name, tuple(labels))
+
+
+def setup_admission(app):
+    """The app's AdmissionControl, or None when ADMISSION_CONTROL is off.
+
+    Buckets live in the RESPONSE_CACHE_BACKEND store, so with redis a
+    caller's rate is counted across workers.
+    """
+    if not app.config['ADMISSION_CONTROL']:
+        return None
+    rates = [app.config['ADMISSION_RATE']] + [
+        rate for rate, burst in app.config['ADMISSION_RATES'].values()]
+    if min(rates) <= 0:
+        raise ValueError('ADMISSION_RATE and ADMISSION_RATES must be '
+                         'positive, got %r' % min(rates))
+    admission = AdmissionControl(
+        make_buckets(app.config['RESPONSE_CACHE_BACKEND'],
+                     app.config['RESPONSE_CACHE_URL']),
+        rate=app.config['ADMISSION_RATE'],
+        burst=app.config['ADMISSION_BURST'],
+        rates=app.config['ADMISSION_RATES'],
+        concurrency=app.config['ADMISSION_CONCURRENCY'],
+        heavy=app.config['ADMISSION_HEAVY_ENDPOINTS'],
+        queue_depth=app.config['ADMISSION_QUEUE_DEPTH'],
+        queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+        retry_after=app.config['ADMISSION_RETRY_AFTER'])
+    app.extensions['admission'] = admission
+
+    @app.errorhandler(Rejected)
+    def rejected(error):
+        response = jsonify({
+            "success": False,
+            "error": error.status,
+            "message": error.message
+            })
+        response.status_code = error.status
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
+
+    return admission
@@ -1,13 +1,31 @@
 # imports
 
-import json
-from flask import Flask, jsonify, request, abort, redirect
+import threading
+from datetime import datetime, timedelta
+from flask import Flask, Response, jsonify, request, abort, redirect
+from flask import g, stream_with_context
 from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
 from jose import jwt
 from functools import wraps
-from urllib.request import urlopen
-from models import setup_db, Movies, Actors
+from models import setup_db, database_path, db, on_write, Movies, Actors
+from models import deleted_since
+from auth_cache import JWKSCache, VerifiedTokenCache
+from pagination import int_arg, date_arg, datetime_arg, page_args
+from pagination import keyset_page
+from export import ndjson_response
+from validation import clean_actor, clean_movie
+from batch import create_batch, update_batch, delete_batch
+from response_cache import ResponseCache, make_backend
+from serialization import JSONEncoder, json_response, list_response
+from db_pool import pool_stats, warm_pool
+from metrics import setup_metrics, span
+from replicas import setup_replicas
+from changes import TABLE_PERMISSIONS, event_stream, setup_changes
+from stats import STATS, StatsRefresher, read_stats, refresh_stats
+from compression import setup_compression
+from coalescer import setup_coalescer
+from bulk_io import setup_bulk_commands
+from admission import setup_admission
 
 
 # App configuration
@@ -15,13 +33,79 @@ from models import setup_db, Movies, Actors
 
 def create_app(test_config=None):
     app = Flask(__name__)
+    app.json_encoder = JSONEncoder
     app.config.from_object('config')
-    setup_db(app)
-    db = SQLAlchemy(app)
-    AUTH0_DOMAIN = 'cshop.auth0.com'
-    ALGORITHMS = ['RS256']
-    API_AUDIENCE = 'capstone'
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+    setup_db(app, app.config.get('DATABASE_URL') or database_path)
+    Migrate(app, db)
+    AUTH0_DOMAIN = app.config['AUTH0_DOMAIN']
+    ALGORITHMS = app.config['ALGORITHMS']
+    API_AUDIENCE = app.config['API_AUDIENCE']
     Client_ID = '54SRzrOYZo9QeLF7oP4dPWrLnijm6dID'
+    jwks_cache = JWKSCache(
+        app.config['JWKS_URL'],
+        ttl=app.config['JWKS_TTL'],
+        refresh_interval=app.config['JWKS_REFRESH_INTERVAL']
+    )
+    app.jwks_cache = jwks_cache
+    token_cache = VerifiedTokenCache(app.config['TOKEN_CACHE_SIZE'])
+    app.token_cache = token_cache
+    compressor = setup_compression(app)
+    response_cache = ResponseCache(
+        make_backend(app.config['RESPONSE_CACHE_BACKEND'],
+                     app.config['RESPONSE_CACHE_URL'],
+                     app.config['RESPONSE_CACHE_SIZE']),
+        ttl=app.config['RESPONSE_CACHE_TTL'],
+        replica_ttl=app.config['READ_YOUR_WRITES_WINDOW'],
+        compressor=compressor
+    )
+    app.response_cache = response_cache
+    read_router = setup_replicas(app)
+    on_write(app, lambda table, op, ids: response_cache.invalidate(table))
+    change_feed = setup_changes(app)
+    coalescer = setup_coalescer(app)
+    setup_bulk_commands(app)
+    admission = setup_admission(app)
+    stats_refresher = StatsRefresher(app)
+    app.extensions['stats_refresher'] = stats_refresher
+
+    def insert_row(model, values):
+        if coalescer is None:
+            return model(**values).insert()
+        return coalescer.insert(model, values)
+
+    def update_row(model, row_id, values):
+        if coalescer is None:
+            return model.update_by_id(row_id, values)
+        return coalescer.update(model, row_id, values)
+
+    def cache_counters():
+        tokens = token_cache.stats()
+        gauges = [
+            ('token_cache_hits_total', tokens['hits']),
+            ('token_cache_misses_total', tokens['misses']),
+            ('response_cache_hits_total', response_cache.hits),
+            ('response_cache_misses_total', response_cache.misses)
+        ]
+        if admission is not None:
+            gauges.extend(admission.gauges())
+        return gauges
+    setup_metrics(app, cache_counters)
+
+    def warm_up():
+        try:
+            with app.app_context():
+                warm_pool(db.get_engine(), app.config['DB_POOL_SIZE'])
+        except Exception as e:
+            print('warm up: database not reachable', e)
+        try:
+            jwks_cache.refresh()
+        except Exception as e:
+            print('warm up: jwks not fetched', e)
+    app.warm_up = warm_up
+    if app.config['WARM_UP']:
+        warm_up()
 
 
 # App authentication
@@ -56,49 +140,55 @@ def create_app(test_config=None):
         if 'permissions' not in payload:
             print('error at check')
             abort(401)
-        if permission not in payload['permissions']:
+        # permission None accepts any token, the handler checks the rest
+        if permission is not None and \
+                permission not in payload['permissions']:
             print('error at check 2')
             abort(401)
         return True
 
     def verify_decode_jwt(token):
-        jsonurl = urlopen('https://cshop.auth0.com/.well-known/jwks.json')
-        jwks = json.loads(jsonurl.read())
+        payload = token_cache.get(token)
+        if payload is not None:
+            return payload
         unverified_header = jwt.get_unverified_header(token)
-        rsa_key = {}
-        for key in jwks['keys']:
-            if key['kid'] == unverified_header['kid']:
-                rsa_key = {
-                    'kty': key['kty'],
-                    'kid': key['kid'],
-                    'use': key['use'],
-                    'n': key['n'],
-                    'e': key['e']
-                }
-        if rsa_key:
-            try:
-                payload = jwt.decode(
-                    token,
-                    rsa_key,
-                    algorithms=ALGORITHMS,
-                    audience=API_AUDIENCE,
-                    issuer='https://' + AUTH0_DOMAIN + '/'
-                )
-                return payload
-            except:
-                return 'Error at rsa_key'
+        rsa_key = jwks_cache.get_key(unverified_header['kid'])
+        if not rsa_key:
+            abort(401)
+        try:
+            payload = jwt.decode(
+                token,
+                rsa_key,
+                algorithms=ALGORITHMS,
+                audience=API_AUDIENCE,
+                issuer='https://' + AUTH0_DOMAIN + '/'
+            )
+            token_cache.set(token, payload)
+            return payload
+        except:
+            return 'Error at rsa_key'
 
     def requires_auth(permission=''):
         def requires_auth_role(f):
             @wraps(f)
             def wrapper(*args, **kwargs):
-                token = get_token_auth_header()
+                with span('auth_header'):
+                    token = get_token_auth_header()
                 try:
-                    payload = verify_decode_jwt(token)
+                    with span('verify_jwt'):
+                        payload = verify_decode_jwt(token)
                 except:
                     abort(401)
-                check_permissions(permission, payload)
-                return f(payload, *args, **kwargs)
+                with span('permissions'):
+                    check_permissions(permission, payload)
+                if read_router is not None:
+                    read_router.route(payload)
+                if admission is not None:
+                    with admission.admit(payload, permission) as hold, \
+                            span('handler'):
+                        return hold(f(payload, *args, **kwargs))
+                with span('handler'):
+                    return f(payload, *args, **kwargs)
             return wrapper
         return requires_auth_role
 
@@ -119,82 +209,286 @@ def create_app(test_config=None):
             "ForAuthenticating": "https://capstone-master.herokuapp.com/login",
             "ForLogout": "https://cshop.auth0.com/v2/logout",
             "Action": "Result",
-            "/actors (GET)": "Gives all actors present",
-            "/movies (GET)": "Gives all movies present",
+            "/pool (GET)": "Database connection pool stats of this worker",
+            "/metrics (GET)": "Prometheus metrics of this worker",
+            "/actors (GET)": "Gives actors, one page per cursor",
+            "/movies (GET)": "Gives movies, one page per cursor",
+            "/search?q=&type=movies|actors (GET)": "Finds titles or names",
+            "/actors?include=cast (GET)": "Actors with the movies they are in",
+            "/movies?include=cast (GET)": "Movies with their cast",
+            "/movies/<movie_id>/actors (GET, POST)": "Cast of movie",
+            "/movies/<movie_id>/actors/<actor_id> (DELETE)": "Uncasts actor",
+            "/actors/<actor_id>/movies (GET)": "Movies the actor is in",
+            "/export/actors (GET)": "Streams every actor as NDJSON",
+            "/export/movies (GET)": "Streams every movie as NDJSON",
+            "/actors?since=<as_of> (GET)": "Actors changed or deleted since",
+            "/movies?since=<as_of> (GET)": "Movies changed or deleted since",
+            "/changes (GET)": "Server-sent events of every write, when "
+                              "CHANGES_STREAMING is on",
+            "/stats/actors (GET)": "Actor counts by gender and age",
+            "/stats/movies (GET)": "Movie counts by release year",
             "/actors/<actor_id> (DELELTE)": "Deletes actor with the id",
             "/movies/<movie_id> (DELELTE)": "Deletes movie with the id",
-            "/actors/<actor_id> (PATCH)": "Edits actor with the id",
-            "/movies/<movie_id> (PATCH)": "Edits movie with the id",
+            "/actors/<actor_id> (PATCH)": "Edits the given fields of actor",
+            "/movies/<movie_id> (PATCH)": "Edits the given fields of movie",
             "/movies (POST)": "Creates new movie",
-            "/actors (POST)": "Cretes new actors"
+            "/actors (POST)": "Cretes new actors",
+            "/actors:batch (POST, PATCH, DELETE)": "Writes a list of actors",
+            "/movies:batch (POST, PATCH, DELETE)": "Writes a list of movies"
         })
 
+    @app.route('/pool')
+    def get_pool_stats():
+        stats = pool_stats(db.get_engine())
+        if read_router is not None:
+            stats['replicas'] = read_router.replicas.stats()
+        return jsonify(stats)
+
+    def included(field, loader):
+        include = request.args.get('include')
+        if include is None:
+            return None
+        if include != 'cast':
+            abort(400)
+        return field, loader
+
+    def sync_fields(model):
+        """Filter of ``?since=`` and the sync fields of a list body."""
+        overlap = app.config['SYNC_OVERLAP']
+        if g.get('read_bind') is not None:
+            # a replica may not have the writes of the last few seconds
+            # yet; rows it lacks must still be newer than as_of
+            overlap = max(overlap, app.config['READ_YOUR_WRITES_WINDOW'])
+        as_of = datetime.utcnow() - timedelta(seconds=overlap)
+        extra = {'as_of': as_of}
+        since = datetime_arg('since')
+        if since is None:
+            return None, extra
+        if 'cursor' not in request.args:
+            extra['Deleted'] = deleted_since(model.__tablename__, since)
+        return model.updated_at > since, extra
+
     @app.route('/actors', methods=['GET'])
     @requires_auth('get:actors')
+    @response_cache.cached('actors', 'movie_actors', 'movies')
     def get_actors(payload):
-        data = Actors.query.all()
-        fromatted_actors = [Actors.format() for Actors in data]
-        return jsonify({
-            "Actors": fromatted_actors
-            })
+        after_id, limit = page_args(
+            app.config['PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+        query = Actors.query
+        if app.config['FAST_SERIALIZATION']:
+            query = query.with_entities(*Actors.format_columns())
+        min_age = int_arg('min_age')
+        max_age = int_arg('max_age')
+        gender = request.args.get('gender')
+        if min_age is not None:
+            query = query.filter(Actors.age >= min_age)
+        if max_age is not None:
+            query = query.filter(Actors.age <= max_age)
+        if gender:
+            query = query.filter(Actors.gender == gender)
+        changed, extra = sync_fields(Actors)
+        if changed is not None:
+            query = query.filter(changed)
+        data, next_cursor = keyset_page(query, Actors.id, after_id, limit)
+        return list_response('Actors', data, next_cursor,
+                             app.config['FAST_SERIALIZATION'],
+                             included('movies', Actors.movies_of), extra)
 
     @app.route('/movies', methods=['GET'])
     @requires_auth('get:movies')
+    @response_cache.cached('movies', 'movie_actors', 'actors')
     def get_movies(payload):
-        data = Movies.query.all()
-        formatted_movies = [Movies.format() for Movies in data]
+        after_id, limit = page_args(
+            app.config['PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+        query = Movies.query
+        if app.config['FAST_SERIALIZATION']:
+            query = query.with_entities(*Movies.format_columns())
+        released_after = date_arg('released_after')
+        released_before = date_arg('released_before')
+        title_prefix = request.args.get('title_prefix')
+        if released_after is not None:
+            query = query.filter(Movies.release_date >= released_after)
+        if released_before is not None:
+            query = query.filter(Movies.release_date <= released_before)
+        if title_prefix:
+            query = query.filter(Movies.title_starts_with(title_prefix))
+        changed, extra = sync_fields(Movies)
+        if changed is not None:
+            query = query.filter(changed)
+        data, next_cursor = keyset_page(query, Movies.id, after_id, limit)
+        return list_response('Movies', data, next_cursor,
+                             app.config['FAST_SERIALIZATION'],
+                             included('cast', Movies.cast_of), extra)
+
+    @app.route('/movies/<int:movie_id>/actors', methods=['GET'])
+    @requires_auth('get:actors')
+    def get_movie_cast(payload, movie_id):
+        if not Movies.existing_ids([movie_id]):
+            abort(422)
+        return json_response({'Actors': Movies.cast_of([movie_id])[movie_id]})
+
+    @app.route('/actors/<int:actor_id>/movies', methods=['GET'])
+    @requires_auth('get:movies')
+    def get_actor_movies(payload, actor_id):
+        if not Actors.existing_ids([actor_id]):
+            abort(422)
+        return json_response({
+            'Movies': Actors.movies_of([actor_id])[actor_id]})
+
+    @app.route('/movies/<int:movie_id>/actors', methods=['POST'])
+    @requires_auth('patch:movies')
+    def add_movie_cast(payload, movie_id):
+        js = request.get_json(silent=True)
+        actor_ids = js.get('actor_ids') if isinstance(js, dict) else None
+        if not isinstance(actor_ids, list) or not actor_ids or \
+                len(actor_ids) > app.config['BATCH_MAX_ITEMS'] or \
+                not all(type(i) is int for i in actor_ids):
+            abort(400)
+        if not Movies.add_cast(movie_id, actor_ids):
+            abort(422)
         return jsonify({
-            'Movies': formatted_movies
+            'Status': True,
+            'Message': 'Your request is executed successfully'
             })
 
+    @app.route('/movies/<int:movie_id>/actors/<int:actor_id>',
+               methods=['DELETE'])
+    @requires_auth('patch:movies')
+    def remove_movie_cast(payload, movie_id, actor_id):
+        if not Movies.remove_cast(movie_id, actor_id):
+            abort(422)
+        return jsonify({
+            'Status': True,
+            'Message': 'Your request is executed successfully'
+            })
+
+    def search_term():
+        term = request.args.get('q', '').strip()
+        if not term or len(term) > app.config['SEARCH_MAX_TERM']:
+            abort(400)
+        limit = int_arg('limit', app.config['SEARCH_LIMIT'])
+        if limit < 1:
+            abort(400)
+        return term, min(limit, app.config['SEARCH_MAX_LIMIT'])
+
+    @requires_auth('get:movies')
+    def search_movies(payload):
+        term, limit = search_term()
+        return json_response({'Movies': [
+            row._asdict() for row in Movies.search(term, limit)]})
+
+    @requires_auth('get:actors')
+    def search_actors(payload):
+        term, limit = search_term()
+        return json_response({'Actors': [
+            row._asdict() for row in Actors.search(term, limit)]})
+
+    @app.route('/search', methods=['GET'])
+    def search():
+        handlers = {'movies': search_movies, 'actors': search_actors}
+        handler = handlers.get(request.args.get('type', 'movies'))
+        if handler is None:
+            abort(400)
+        return handler()
+
+    @app.route('/export/actors', methods=['GET'])
+    @requires_auth('get:actors')
+    def export_actors(payload):
+        query = Actors.query.with_entities(
+            *Actors.format_columns()).order_by(Actors.id)
+        return ndjson_response(query, app.config['EXPORT_BATCH_SIZE'])
+
+    @app.route('/export/movies', methods=['GET'])
+    @requires_auth('get:movies')
+    def export_movies(payload):
+        query = Movies.query.with_entities(
+            *Movies.format_columns()).order_by(Movies.id)
+        return ndjson_response(query, app.config['EXPORT_BATCH_SIZE'])
+
+    def stats_response(key, stat):
+        counts, refreshed_at = read_stats(
+            stat, app.config['STATS_MAX_AGE'], stats_refresher,
+            app.config['STATS_AGE_BUCKET'])
+        return json_response({key: counts, 'refreshed_at': refreshed_at})
+
+    @app.route('/stats/actors', methods=['GET'])
+    @requires_auth('get:actors')
+    def get_actor_stats(payload):
+        return stats_response('Actors', 'actors')
+
+    @app.route('/stats/movies', methods=['GET'])
+    @requires_auth('get:movies')
+    def get_movie_stats(payload):
+        return stats_response('Movies', 'movies')
+
+    @app.cli.command('refresh-stats')
+    def refresh_stats_command():
+        """Recompute the /stats summaries, e.g. from a scheduler."""
+        for stat in STATS:
+            refresh_stats(stat, app.config['STATS_AGE_BUCKET'])
+
+    if change_feed is not None:
+        change_streams = threading.BoundedSemaphore(
+            app.config['CHANGES_MAX_STREAMS'])
+
+        @app.route('/changes', methods=['GET'])
+        @requires_auth(None)
+        def changes(payload):
+            tables = {table for table, permission in TABLE_PERMISSIONS.items()
+                      if permission in payload['permissions']}
+            if not tables:
+                abort(401)
+            if not change_streams.acquire(blocking=False):
+                response = jsonify({
+                    "success": False,
+                    "error": 503,
+                    "message": "Too many change streams, try again later"
+                    })
+                response.status_code = 503
+                response.headers['Retry-After'] = '5'
+                return response
+            stream = event_stream(
+                change_feed, tables, request.headers.get('Last-Event-ID'),
+                heartbeat=app.config['CHANGES_HEARTBEAT'],
+                duration=app.config['CHANGES_STREAM_SECONDS'])
+            response = Response(stream_with_context(stream),
+                                mimetype='text/event-stream')
+            # the server closes the response when the stream ends or the
+            # client goes away
+            response.call_on_close(change_streams.release)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['X-Accel-Buffering'] = 'no'
+            return response
+
     @app.route('/actors/<actor_id>', methods=['DELETE'])
     @requires_auth('delete:actors')
     def delete_actors(payload, actor_id):
-        temp = Actors.query.filter_by(id=actor_id).all()
-        if temp == []:
+        if Actors.delete_by_id(actor_id) is None:
             abort(422)
-        else:
-            Actors.query.filter_by(id=actor_id).delete()
-            db.session.commit()
-            return jsonify({
-                'Status': True,
-                'Message': 'Your request is executed successfully'
-                })
+        return jsonify({
+            'Status': True,
+            'Message': 'Your request is executed successfully'
+            })
 
     @app.route('/movies/<movie_id>', methods=['DELETE'])
     @requires_auth('delete:movies')
     def delete_movies(payload, movie_id):
-        temp = Movies.query.filter_by(id=movie_id).all()
-        if temp == []:
+        if Movies.delete_by_id(movie_id) is None:
             abort(422)
-            return jsonify({
-                'status': False,
-                'Message': 'There is no actor/movie with provided id'
+        return jsonify({
+            'Status': True,
+            'Message': 'Your request is executed successfully'
             })
-        else:
-            Movies.query.filter_by(id=movie_id).delete()
-            db.session.commit()
-            return jsonify({
-                'Status': True,
-                'Message': 'Your request is executed successfully'
-                })
 
     @app.route('/actors', methods=['POST'])
     @requires_auth('post:actors')
     def create_actors(payload):
         js = request.get_json()
-        print(js["age"])
-        if js["name"] == "" or js["age"] == 0 or js["gender"] == "":
+        values, errors = clean_actor(js)
+        if errors:
             abort(400)
         else:
-            data = Actors(
-                name=js["name"],
-                age=js["age"],
-                gender=js["gender"]
-            )
-            print(data)
-            db.session.add(data)
-            db.session.commit()
+            insert_row(Actors, values)
         return jsonify({
             'Status': True,
             'Message': 'Your request is executed successfully'
@@ -204,67 +498,71 @@ def create_app(test_config=None):
     @requires_auth('post:movies')
     def create_movies(payload):
         js = request.get_json()
-        if js["title"] == "" or js["release_date"] == "":
+        values, errors = clean_movie(js)
+        if errors:
             abort(400)
         else:
-            data = Movies(
-                title=js["title"],
-                release_date=js["release_date"]
-            )
-            print(data)
-            db.session.add(data)
-            db.session.commit()
+            insert_row(Movies, values)
         return jsonify({
             'Status': True,
             'Message': 'Your request is executed successfully'
             })
 
+    @app.route('/actors:batch', methods=['POST'])
+    @requires_auth('post:actors')
+    def create_actors_batch(payload):
+        return create_batch(Actors, clean_actor, app.config['BATCH_MAX_ITEMS'])
+
+    @app.route('/movies:batch', methods=['POST'])
+    @requires_auth('post:movies')
+    def create_movies_batch(payload):
+        return create_batch(Movies, clean_movie, app.config['BATCH_MAX_ITEMS'])
+
+    @app.route('/actors:batch', methods=['PATCH'])
+    @requires_auth('patch:actors')
+    def update_actors_batch(payload):
+        return update_batch(Actors, clean_actor, app.config['BATCH_MAX_ITEMS'])
+
+    @app.route('/movies:batch', methods=['PATCH'])
+    @requires_auth('patch:movies')
+    def update_movies_batch(payload):
+        return update_batch(Movies, clean_movie, app.config['BATCH_MAX_ITEMS'])
+
+    @app.route('/actors:batch', methods=['DELETE'])
+    @requires_auth('delete:actors')
+    def delete_actors_batch(payload):
+        return delete_batch(Actors, app.config['BATCH_MAX_ITEMS'])
+
+    @app.route('/movies:batch', methods=['DELETE'])
+    @requires_auth('delete:movies')
+    def delete_movies_batch(payload):
+        return delete_batch(Movies, app.config['BATCH_MAX_ITEMS'])
+
     @app.route('/actors/<actor_id>', methods=['PATCH'])
     @requires_auth('patch:actors')
     def update_actors(payload, actor_id):
-        temp = Actors.query.filter_by(id=actor_id).all()
-        if temp == []:
+        values, errors = clean_actor(request.get_json(), partial=True)
+        if errors or not values:
+            abort(400)
+        if update_row(Actors, actor_id, values) is None:
             abort(422)
-        else:
-            js = request.get_json()
-            print(js["age"])
-            if js["name"] == "" or js["age"] == 0 or js["gender"] == "":
-                abort(400)
-            else:
-                updated_name = js["name"],
-                updated_age = js["age"],
-                updated_gender = js["gender"]
-                actor = Actors.query.filter_by(id=actor_id).first()
-                actor.name = updated_name
-                actor.age = updated_age
-                actor.gender = updated_gender
-                db.session.commit()
-                return jsonify({
-                    'Status': True,
-                    'Message': 'Your request is executed successfully'
-                    })
+        return jsonify({
+            'Status': True,
+            'Message': 'Your request is executed successfully'
+            })
 
     @app.route('/movies/<movie_id>', methods=['PATCH'])
     @requires_auth('patch:movies')
     def update_movies(payload, movie_id):
-        temp = Movies.query.filter_by(id=movie_id).all()
-        if temp == []:
+        values, errors = clean_movie(request.get_json(), partial=True)
+        if errors or not values:
+            abort(400)
+        if update_row(Movies, movie_id, values) is None:
             abort(422)
-        else:
-            js = request.get_json()
-            if js["title"] == "" or js["release_date"] == "":
-                abort(400)
-            else:
-                updated_title = js["title"],
-                updated_release_date = js["release_date"]
-                movie = Movies.query.filter_by(id=movie_id).first()
-                movie.title = updated_title
-                movie.release_date = updated_release_date
-                db.session.commit()
-                return jsonify({
-                    'Status': True,
-                    'Message': 'Your request is executed successfully'
-                    })
+        return jsonify({
+            'Status': True,
+            'Message': 'Your request is executed successfully'
+            })
 
 
 # error handlers
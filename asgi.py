@@ -0,0 +1,391 @@
+"""ASGI entry point, an alternative to main.py:
+
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+
+Serves the actor and movie routes of app.create_app with the same auth
+rules and error bodies, but every handler is a coroutine: postgres is
+reached through an asyncpg pool and the JWKS through AsyncJWKSCache, so a
+worker keeps serving other requests while one waits on I/O. The batch,
+export and pool endpoints are only served by the WSGI app.
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+
+import asyncpg
+from jose import jwt
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import JSONResponse, RedirectResponse, Response
+from starlette.routing import Route
+from werkzeug.exceptions import HTTPException as WerkzeugHTTPException
+
+import config
+from auth_cache import AsyncJWKSCache, VerifiedTokenCache
+from models import database_path, like_prefix
+from pagination import int_arg, date_arg, datetime_arg, page_args
+from pagination import encode_cursor
+from serialization import dumps
+from validation import clean_actor, clean_movie
+
+ERROR_MESSAGES = {
+    400: 'Please make sure all data is given',
+    401: 'Unauthorized',
+    403: 'Authorization not found',
+    404: 'resource not found',
+    405: 'Method Not Allowed',
+    422: 'There is no actor/movie with provided id',
+    423: 'Invalid header'
+}
+
+SUCCESS = {
+    'Status': True,
+    'Message': 'Your request is executed successfully'
+}
+
+
+# Database
+
+class Database:
+    """asyncpg pool, sized like the WSGI engine's pool."""
+
+    def __init__(self, dsn, min_size=1, max_size=10, statement_timeout=0):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_timeout = statement_timeout
+        self.pool = None
+
+    async def connect(self):
+        settings = {}
+        if self.statement_timeout:
+            settings['statement_timeout'] = str(self.statement_timeout)
+        self.pool = await asyncpg.create_pool(
+            self.dsn, min_size=self.min_size, max_size=self.max_size,
+            server_settings=settings)
+
+    async def disconnect(self):
+        await self.pool.close()
+
+    async def fetch(self, query, *args):
+        return await self.pool.fetch(query, *args)
+
+    async def fetchval(self, query, *args):
+        return await self.pool.fetchval(query, *args)
+
+
+def _settings(overrides):
+    settings = {k: getattr(config, k) for k in dir(config) if k.isupper()}
+    settings.update(overrides or {})
+    return settings
+
+
+def _parse_id(row_id):
+    try:
+        return int(row_id)
+    except ValueError:
+        raise HTTPException(422)
+
+
+async def _json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(400)
+
+
+# App
+
+def create_asgi_app(settings=None, database=None):
+    settings = _settings(settings)
+    if database is None:
+        database = Database(
+            settings['DATABASE_URL'] or database_path,
+            max_size=settings['DB_POOL_SIZE'] + settings['DB_MAX_OVERFLOW'],
+            statement_timeout=settings['DB_STATEMENT_TIMEOUT'])
+    jwks_cache = AsyncJWKSCache(
+        settings['JWKS_URL'],
+        ttl=settings['JWKS_TTL'],
+        refresh_interval=settings['JWKS_REFRESH_INTERVAL']
+    )
+    token_cache = VerifiedTokenCache(settings['TOKEN_CACHE_SIZE'])
+
+# App authentication, same rules as app.py
+
+    def get_token_auth_header(request):
+        auth = request.headers.get('Authorization', None)
+        if not auth:
+            raise HTTPException(403)
+        parts = auth.split(' ')
+        if parts[0].lower() != 'bearer':
+            raise HTTPException(403)
+        elif len(parts) != 2:
+            raise HTTPException(423)
+        return parts[1]
+
+    def check_permissions(permission, payload):
+        if 'permissions' not in payload:
+            raise HTTPException(401)
+        if permission not in payload['permissions']:
+            raise HTTPException(401)
+        return True
+
+    async def verify_decode_jwt(token):
+        payload = token_cache.get(token)
+        if payload is not None:
+            return payload
+        unverified_header = jwt.get_unverified_header(token)
+        rsa_key = await jwks_cache.get_key_async(unverified_header['kid'])
+        payload = jwt.decode(
+            token,
+            rsa_key,
+            algorithms=settings['ALGORITHMS'],
+            audience=settings['API_AUDIENCE'],
+            issuer='https://' + settings['AUTH0_DOMAIN'] + '/'
+        )
+        token_cache.set(token, payload)
+        return payload
+
+    def requires_auth(permission=''):
+        def requires_auth_role(f):
+            @wraps(f)
+            async def wrapper(request):
+                token = get_token_auth_header(request)
+                try:
+                    payload = await verify_decode_jwt(token)
+                except Exception:
+                    raise HTTPException(401)
+                check_permissions(permission, payload)
+                return await f(request, payload)
+            return wrapper
+        return requires_auth_role
+
+# Queries
+
+    async def select_page(key, table, columns, where, params, args):
+        after_id, limit = page_args(
+            settings['PAGE_SIZE'], settings['MAX_PAGE_SIZE'], args)
+        where = list(where)
+        params = list(params)
+        body = {'as_of': datetime.utcnow() - timedelta(
+            seconds=settings['SYNC_OVERLAP'])}
+        since = datetime_arg('since', args=args)
+        if since is not None:
+            params.append(since)
+            where.append('updated_at > $%d' % len(params))
+            if 'cursor' not in args:
+                deleted = await database.fetch(
+                    'SELECT row_id FROM tombstones WHERE table_name = $1 '
+                    'AND deleted_at > $2 ORDER BY row_id', table, since)
+                body['Deleted'] = [row['row_id'] for row in deleted]
+        if after_id is not None:
+            params.append(after_id)
+            where.append('id > $%d' % len(params))
+        params.append(limit + 1)
+        query = 'SELECT %s FROM %s' % (', '.join(columns), table)
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY id LIMIT $%d' % len(params)
+        rows = await database.fetch(query, *params)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]['id'])
+        body.update({
+            key: [dict(row) for row in rows],
+            'next_cursor': next_cursor
+            })
+        return Response(dumps(body), media_type='application/json')
+
+    async def insert(table, values):
+        values = dict(values, updated_at=datetime.utcnow())
+        columns = list(values)
+        placeholders = ['$%d' % (i + 1) for i in range(len(columns))]
+        return await database.fetchval(
+            'INSERT INTO %s (%s) VALUES (%s) RETURNING id' % (
+                table, ', '.join(columns), ', '.join(placeholders)),
+            *values.values())
+
+    async def update_by_id(table, row_id, values):
+        values = dict(values, updated_at=datetime.utcnow())
+        columns = list(values)
+        assignments = ['%s = $%d' % (c, i + 1) for i, c in enumerate(columns)]
+        return await database.fetchval(
+            'UPDATE %s SET %s WHERE id = $%d RETURNING id' % (
+                table, ', '.join(assignments), len(columns) + 1),
+            *values.values(), row_id)
+
+    async def delete_by_id(table, row_id):
+        # the row and its tombstone go in one statement
+        return await database.fetchval(
+            'WITH deleted AS (DELETE FROM %s WHERE id = $1 RETURNING id) '
+            'INSERT INTO tombstones (table_name, row_id, deleted_at) '
+            'SELECT $2, id, $3 FROM deleted RETURNING row_id' % table,
+            row_id, table, datetime.utcnow())
+
+# Endpoints
+
+    async def login(request):
+        link = 'https://cshop.auth0.com/authorize?'
+        link = link + 'audience=capstone&response_type=token&'
+        link = link + 'client_id=54SRzrOYZo9QeLF7oP4dPWrLnijm6dID&'
+        link = link + 'redirect_uri=https://capstone-master.herokuapp.com/'
+        return RedirectResponse(link, status_code=302)
+
+    async def start_up(request):
+        return JSONResponse({
+            "ForAuthenticating": "https://capstone-master.herokuapp.com/login",
+            "ForLogout": "https://cshop.auth0.com/v2/logout",
+            "Action": "Result",
+            "/actors (GET)": "Gives actors, one page per cursor",
+            "/movies (GET)": "Gives movies, one page per cursor",
+            "/actors/<actor_id> (DELELTE)": "Deletes actor with the id",
+            "/movies/<movie_id> (DELELTE)": "Deletes movie with the id",
+            "/actors/<actor_id> (PATCH)": "Edits the given fields of actor",
+            "/movies/<movie_id> (PATCH)": "Edits the given fields of movie",
+            "/movies (POST)": "Creates new movie",
+            "/actors (POST)": "Cretes new actors"
+        })
+
+    @requires_auth('get:actors')
+    async def get_actors(request, payload):
+        args = request.query_params
+        where = []
+        params = []
+        min_age = int_arg('min_age', args=args)
+        max_age = int_arg('max_age', args=args)
+        gender = args.get('gender')
+        if min_age is not None:
+            params.append(min_age)
+            where.append('age >= $%d' % len(params))
+        if max_age is not None:
+            params.append(max_age)
+            where.append('age <= $%d' % len(params))
+        if gender:
+            params.append(gender)
+            where.append('gender = $%d' % len(params))
+        return await select_page('Actors', 'actors',
+                                 ('id', 'name', 'age', 'gender',
+                                  'updated_at'),
+                                 where, params, args)
+
+    @requires_auth('get:movies')
+    async def get_movies(request, payload):
+        args = request.query_params
+        where = []
+        params = []
+        released_after = date_arg('released_after', args=args)
+        released_before = date_arg('released_before', args=args)
+        title_prefix = args.get('title_prefix')
+        if released_after is not None:
+            params.append(released_after)
+            where.append('release_date >= $%d' % len(params))
+        if released_before is not None:
+            params.append(released_before)
+            where.append('release_date <= $%d' % len(params))
+        if title_prefix:
+            params.append(like_prefix(title_prefix))
+            where.append("title LIKE $%d ESCAPE '\\'" % len(params))
+        return await select_page('Movies', 'movies',
+                                 ('id', 'title', 'release_date',
+                                  'updated_at'),
+                                 where, params, args)
+
+    @requires_auth('post:actors')
+    async def create_actors(request, payload):
+        values, errors = clean_actor(await _json_body(request))
+        if errors:
+            raise HTTPException(400)
+        await insert('actors', values)
+        return JSONResponse(SUCCESS)
+
+    @requires_auth('post:movies')
+    async def create_movies(request, payload):
+        values, errors = clean_movie(await _json_body(request))
+        if errors:
+            raise HTTPException(400)
+        await insert('movies', values)
+        return JSONResponse(SUCCESS)
+
+    @requires_auth('patch:actors')
+    async def update_actors(request, payload):
+        row_id = _parse_id(request.path_params['actor_id'])
+        values, errors = clean_actor(await _json_body(request), partial=True)
+        if errors or not values:
+            raise HTTPException(400)
+        if await update_by_id('actors', row_id, values) is None:
+            raise HTTPException(422)
+        return JSONResponse(SUCCESS)
+
+    @requires_auth('patch:movies')
+    async def update_movies(request, payload):
+        row_id = _parse_id(request.path_params['movie_id'])
+        values, errors = clean_movie(await _json_body(request), partial=True)
+        if errors or not values:
+            raise HTTPException(400)
+        if await update_by_id('movies', row_id, values) is None:
+            raise HTTPException(422)
+        return JSONResponse(SUCCESS)
+
+    @requires_auth('delete:actors')
+    async def delete_actors(request, payload):
+        row_id = _parse_id(request.path_params['actor_id'])
+        if await delete_by_id('actors', row_id) is None:
+            raise HTTPException(422)
+        return JSONResponse(SUCCESS)
+
+    @requires_auth('delete:movies')
+    async def delete_movies(request, payload):
+        row_id = _parse_id(request.path_params['movie_id'])
+        if await delete_by_id('movies', row_id) is None:
+            raise HTTPException(422)
+        return JSONResponse(SUCCESS)
+
+# error handlers
+
+    async def http_error(request, exc):
+        code = exc.status_code if isinstance(exc, HTTPException) else exc.code
+        return JSONResponse({
+            "success": False,
+            "error": code,
+            "message": ERROR_MESSAGES.get(code, str(exc))
+            }, status_code=code)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await database.connect()
+        yield
+        await database.disconnect()
+
+    routes = [
+        Route('/', start_up),
+        Route('/login', login),
+        Route('/actors', get_actors, methods=['GET']),
+        Route('/actors', create_actors, methods=['POST']),
+        Route('/movies', get_movies, methods=['GET']),
+        Route('/movies', create_movies, methods=['POST']),
+        Route('/actors/{actor_id}', update_actors, methods=['PATCH']),
+        Route('/actors/{actor_id}', delete_actors, methods=['DELETE']),
+        Route('/movies/{movie_id}', update_movies, methods=['PATCH']),
+        Route('/movies/{movie_id}', delete_movies, methods=['DELETE']),
+    ]
+    app = Starlette(
+        routes=routes,
+        middleware=[Middleware(
+            GZipMiddleware,
+            minimum_size=settings['COMPRESSION_MIN_SIZE'],
+            compresslevel=settings['COMPRESSION_GZIP_LEVEL'])],
+        exception_handlers={
+            HTTPException: http_error,
+            WerkzeugHTTPException: http_error
+        },
+        lifespan=lifespan)
+    app.state.database = database
+    app.state.jwks_cache = jwks_cache
+    app.state.token_cache = token_cache
+    return app
+
+
+app = create_asgi_app()
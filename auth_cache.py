@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.request import urlopen
+
+
+# JWKS key store
+
+def fetch_jwks(url, timeout=5):
+    # urlopen also understands file:// urls, which is what the tests use
+    # to point the cache at a local key set.
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+class JWKSCache:
+    """In-process cache of the signing keys published at a JWKS url.
+
+    Keys are kept by ``kid`` for ``ttl`` seconds. Once they expire the old
+    keys keep being served (for at most ``max_stale`` seconds) while a
+    background thread fetches the new set. A token carrying an unknown
+    ``kid`` forces a synchronous refresh, but no more often than once every
+    ``refresh_interval`` seconds.
+    """
+
+    def __init__(self, url, ttl=600, refresh_interval=30, max_stale=86400,
+                 fetch=fetch_jwks, clock=time.monotonic):
+        self.url = url
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.max_stale = max_stale
+        self.fetch = fetch
+        self.clock = clock
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get_key(self, kid):
+        mode = self._refresh_mode()
+        if mode == 'now':
+            self.refresh()
+        elif mode == 'background':
+            self._refresh_in_background()
+        key = self._keys.get(kid)
+        if key is None and self._may_force_refresh():
+            self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self):
+        with self._lock:
+            self._last_attempt = self.clock()
+            self._store(self.fetch(self.url))
+
+    def _refresh_mode(self):
+        """'now' if keys must be fetched before use, 'background' if the
+        stale keys may be served while they are fetched, else None."""
+        if self._fetched_at is None:
+            return 'now'
+        age = self.clock() - self._fetched_at
+        if age >= self.ttl + self.max_stale:
+            return 'now'
+        if age >= self.ttl and self._may_force_refresh():
+            return 'background'
+        return None
+
+    def _store(self, jwks):
+        keys = {}
+        for key in jwks['keys']:
+            keys[key['kid']] = {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            }
+        self._keys = keys
+        self._fetched_at = self.clock()
+
+    def _may_force_refresh(self):
+        if self._last_attempt is None:
+            return True
+        return self.clock() - self._last_attempt >= self.refresh_interval
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # keep serving the stale keys, the next request retries
+                print('jwks refresh failed')
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+async def fetch_jwks_async(url, timeout=5):
+    if not url.startswith(('http://', 'https://')):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fetch_jwks, url, timeout)
+    import httpx
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        response = await client.get(url)
+        response.raise_for_status()
+        return response.json()
+
+
+class AsyncJWKSCache(JWKSCache):
+    """JWKSCache for the ASGI app: fetches never block the event loop.
+
+    Same expiry, stale-while-revalidate and unknown ``kid`` rules; the
+    background refresh runs as a task on the loop instead of a thread.
+    """
+
+    def __init__(self, url, fetch_async=fetch_jwks_async, **kwargs):
+        super().__init__(url, **kwargs)
+        self.fetch_async = fetch_async
+        self._task = None
+
+    async def get_key_async(self, kid):
+        mode = self._refresh_mode()
+        if mode == 'now':
+            await self.refresh_async()
+        elif mode == 'background' and self._task is None:
+            self._task = asyncio.ensure_future(self._refresh_task())
+        key = self._keys.get(kid)
+        if key is None and self._may_force_refresh():
+            await self.refresh_async()
+            key = self._keys.get(kid)
+        return key
+
+    async def refresh_async(self):
+        self._last_attempt = self.clock()
+        self._store(await self.fetch_async(self.url))
+
+    async def _refresh_task(self):
+        try:
+            await self.refresh_async()
+        except Exception:
+            print('jwks refresh failed')
+        finally:
+            self._task = None
+
+
+# Verified token cache
+
+class VerifiedTokenCache:
+    """Bounded LRU of already verified tokens and their decoded payloads.
+
+    Tokens are stored by their sha256 digest and dropped once the ``exp``
+    claim has passed, so a cached payload is never served for a token that
+    ``jwt.decode`` would now reject as expired. Tokens without ``exp`` are
+    not cached.
+    """
+
+    def __init__(self, maxsize=1024, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[1] <= self.clock():
+                del self._entries[digest]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token, payload):
+        exp = payload.get('exp') if isinstance(payload, dict) else None
+        if not exp or self.maxsize <= 0:
+            return
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (payload, exp)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries)
+        }
+
+    def _digest(self, token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
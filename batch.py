@@ -0,0 +1,116 @@
+from flask import abort, jsonify, request
+
+from models import db, after_commit
+
+
+# Batch endpoints
+#
+# A batch is validated in full before anything is written. If any item is
+# rejected nothing is written and every item's result is returned with the
+# error status; otherwise all items are written in a single transaction.
+
+def batch_items(max_items):
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items or len(items) > max_items:
+        abort(400)
+    return items
+
+
+def _item_id(item):
+    value = item.get('id') if isinstance(item, dict) else item
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return value
+
+
+def _response(results):
+    statuses = [result['status'] for result in results]
+    failed = [status for status in statuses if status >= 400]
+    if failed:
+        status = 400 if 400 in failed else 422
+        return jsonify({
+            'success': False,
+            'error': status,
+            'message': 'No item was written, see results',
+            'results': results
+            }), status
+    return jsonify({
+        'Status': True,
+        'Message': 'Your request is executed successfully',
+        'results': results
+        })
+
+
+def _check_ids(model, items, clean=None):
+    """Validate the ids (and bodies when ``clean`` is given) of a batch."""
+    ids = [_item_id(item) for item in items]
+    existing = model.existing_ids([i for i in ids if i is not None])
+    seen = set()
+    rows = []
+    results = []
+    for index, (item, item_id) in enumerate(zip(items, ids)):
+        errors = []
+        values = {}
+        if clean is not None:
+            values, errors = clean(item, partial=True)
+            if not values and not errors:
+                errors.append('nothing to update')
+        if item_id is None:
+            errors.append('id must be an integer')
+        elif item_id in seen:
+            errors.append('duplicate id')
+        seen.add(item_id)
+        if errors:
+            results.append({'index': index, 'id': item_id,
+                            'status': 400, 'errors': errors})
+        elif item_id not in existing:
+            results.append({'index': index, 'id': item_id, 'status': 422,
+                            'errors': ['There is no actor/movie with '
+                                       'provided id']})
+        else:
+            values['id'] = item_id
+            rows.append(values)
+            results.append({'index': index, 'id': item_id, 'status': 200})
+    return rows, results
+
+
+def create_batch(model, clean, max_items):
+    items = batch_items(max_items)
+    rows = []
+    results = []
+    for index, item in enumerate(items):
+        values, errors = clean(item)
+        if errors:
+            results.append({'index': index, 'status': 400, 'errors': errors})
+        else:
+            rows.append(values)
+            results.append({'index': index, 'status': 201})
+    if len(rows) == len(items):
+        ids = model.bulk_create(rows)
+        db.session.commit()
+        after_commit(model.__tablename__, 'create', ids)
+        for result, row_id in zip(results, ids):
+            result['id'] = row_id
+    return _response(results)
+
+
+def update_batch(model, clean, max_items):
+    items = batch_items(max_items)
+    rows, results = _check_ids(model, items, clean)
+    if len(rows) == len(items):
+        model.bulk_update(rows)
+        db.session.commit()
+        after_commit(model.__tablename__, 'update',
+                     [row['id'] for row in rows])
+    return _response(results)
+
+
+def delete_batch(model, max_items):
+    items = batch_items(max_items)
+    rows, results = _check_ids(model, items)
+    if len(rows) == len(items):
+        ids = [row['id'] for row in rows]
+        model.bulk_delete(ids)
+        db.session.commit()
+        after_commit(model.__tablename__, 'delete', ids)
+    return _response(results)
@@ -0,0 +1,93 @@
+"""Latency of cheap lookups while heavy list calls flood the worker.
+
+    python -m benchmarks.bench_admission [--database-url URL] \\
+        [seconds] [heavy_threads]
+
+``heavy_threads`` threads page through GET /movies?limit=1000 while one
+thread keeps calling GET /movies/<id>/actors, with admission control off
+and then on (heavy routes capped at two at a time). Prints the lookup
+percentiles and how the heavy calls fared; the response cache is off so
+every call does its work. The tables are seeded once, into a throwaway
+sqlite file or into --database-url, which must be a scratch database with
+empty tables.
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import LocalAuth, is_empty, make_app, percentile, seed
+
+CONFIG = {
+    'RESPONSE_CACHE_BACKEND': 'none',
+    'ADMISSION_RATE': 100000,
+    'ADMISSION_BURST': 100000,
+    'ADMISSION_CONCURRENCY': {'heavy': 2, 'write': 8, 'light': 16},
+    'ADMISSION_QUEUE_DEPTH': 4,
+    'ADMISSION_QUEUE_TIMEOUT': 0.5
+}
+
+
+def run(auth, database_url, movie_ids, seconds, heavy_threads, **config):
+    app = make_app(auth, database_url, **config)
+    headers = auth.headers()
+    deadline = time.perf_counter() + seconds
+    lookups = []
+    heavy = Counter()
+
+    def heavy_worker():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            res = client.get('/movies?limit=1000', headers=headers)
+            heavy[res.status_code] += 1
+
+    def lookup_worker():
+        client = app.test_client()
+        i = 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            res = client.get('/movies/%d/actors' % movie_ids[
+                i % len(movie_ids)], headers=headers)
+            assert res.status_code == 200, res.status_code
+            lookups.append(time.perf_counter() - start)
+            i += 1
+
+    threads = [threading.Thread(target=heavy_worker)
+               for _ in range(heavy_threads)]
+    threads.append(threading.Thread(target=lookup_worker))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    lookups.sort()
+    return lookups, heavy
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.bench_admission')
+    parser.add_argument('--database-url')
+    parser.add_argument('seconds', type=int, nargs='?', default=10)
+    parser.add_argument('heavy_threads', type=int, nargs='?', default=8)
+    options = parser.parse_args(argv)
+    auth = LocalAuth()
+    app = make_app(auth, options.database_url)
+    if not is_empty(app):
+        auth.close()
+        parser.error('the tables of --database-url are not empty')
+    movie_ids = seed(app, actors=2000, movies=5000, cast=3)[1]
+    for name, config in [('off', {'RESPONSE_CACHE_BACKEND': 'none'}),
+                         ('on', dict(CONFIG, ADMISSION_CONTROL=True))]:
+        lookups, heavy = run(auth, app.config['DATABASE_URL'], movie_ids,
+                             options.seconds, options.heavy_threads,
+                             **config)
+        print('admission %-3s  lookups %6d  p50 %7.2f ms  p99 %7.2f ms  '
+              'heavy %s' % (
+                  name, len(lookups), percentile(lookups, 50) * 1000,
+                  percentile(lookups, 99) * 1000,
+                  ' '.join('%d=%d' % item for item in sorted(heavy.items()))))
+    auth.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
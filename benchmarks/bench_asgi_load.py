@@ -0,0 +1,97 @@
+"""Throughput of the sync (gunicorn main:app) and async (asgi:app) modes.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_asgi_load \\
+        [seconds] [workers]
+
+Starts both servers against the same database with a local JWKS and the
+response cache turned off, then for 100, 500 and 1000 concurrent clients
+sends GET /movies for ``seconds`` and reports requests/sec and latency
+percentiles. asyncpg only speaks postgres, so DATABASE_URL must point at
+a postgres database holding the capstone tables.
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.common import LocalAuth, percentile
+
+SERVERS = {
+    'sync': ['gunicorn', 'main:app', '-b', '127.0.0.1:8701'],
+    'async': ['gunicorn', 'asgi:app', '-k', 'uvicorn.workers.UvicornWorker',
+              '-b', '127.0.0.1:8702'],
+}
+PORTS = {'sync': 8701, 'async': 8702}
+CONCURRENCY = (100, 500, 1000)
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server on port %d did not start' % port)
+
+
+async def load(url, headers, clients, seconds):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=clients)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def run():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    res = await client.get(url, headers=headers)
+                    ok = res.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+        await asyncio.gather(*[run() for _ in range(clients)])
+    latencies.sort()
+    return {
+        'requests_per_sec': len(latencies) / seconds,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'errors': errors
+    }
+
+
+def main(seconds=10, workers=4):
+    auth = LocalAuth()
+    headers = auth.headers()
+    env = dict(os.environ, JWKS_URL=auth.jwks_url,
+               RESPONSE_CACHE_BACKEND='none')
+    for mode, command in SERVERS.items():
+        server = subprocess.Popen(command + ['-w', str(workers)], env=env)
+        try:
+            wait_for_port(PORTS[mode])
+            url = 'http://127.0.0.1:%d/movies' % PORTS[mode]
+            for clients in CONCURRENCY:
+                result = asyncio.run(load(url, headers, clients, seconds))
+                print('%-5s %5d clients  %8.1f req/s  p50 %7.1f ms  '
+                      'p99 %7.1f ms  errors %d' % (
+                          mode, clients, result['requests_per_sec'],
+                          result['p50_ms'], result['p99_ms'],
+                          result['errors']))
+        finally:
+            server.terminate()
+            server.wait()
+    auth.close()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
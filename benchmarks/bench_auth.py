@@ -0,0 +1,38 @@
+"""Cold vs warm cost of an authenticated request.
+
+    python -m benchmarks.bench_auth [requests]
+
+Cold requests clear the verified-token cache first, so every call pays the
+RS256 signature check. Warm requests hit the cache.
+"""
+import sys
+
+from benchmarks.common import LocalAuth, make_app, timed
+
+
+def main(repeat=500):
+    auth = LocalAuth()
+    app = make_app(auth)
+    client = app.test_client()
+    headers = auth.headers()
+
+    def request():
+        res = client.get('/actors', headers=headers)
+        assert res.status_code == 200, res.status_code
+
+    def cold():
+        app.token_cache.clear()
+        request()
+
+    request()
+    cold_time = timed(cold, repeat)
+    warm_time = timed(request, repeat)
+    print('cold  %8.1f us/request' % (cold_time * 1e6))
+    print('warm  %8.1f us/request' % (warm_time * 1e6))
+    print('speedup %.1fx' % (cold_time / warm_time))
+    print('token cache', app.token_cache.stats())
+    auth.close()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,41 @@
+"""Rows/sec of the single-item POST path against the batch endpoints.
+
+    python -m benchmarks.bench_batch [rows] [batch_size]
+"""
+import sys
+import time
+
+from benchmarks.common import LocalAuth, make_app
+
+
+def actor(i):
+    return {'name': 'actor %d' % i, 'age': 20 + i % 50, 'gender': 'FM'[i % 2]}
+
+
+def main(rows=2000, batch_size=500):
+    auth = LocalAuth()
+    headers = auth.headers()
+
+    client = make_app(auth).test_client()
+    start = time.perf_counter()
+    for i in range(rows):
+        res = client.post('/actors', headers=headers, json=actor(i))
+        assert res.status_code == 200, res.status_code
+    single = rows / (time.perf_counter() - start)
+
+    client = make_app(auth).test_client()
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        body = [actor(i) for i in range(offset, min(rows, offset + batch_size))]
+        res = client.post('/actors:batch', headers=headers, json=body)
+        assert res.status_code == 200, res.status_code
+    batched = rows / (time.perf_counter() - start)
+
+    print('single  %10.0f rows/sec' % single)
+    print('batch   %10.0f rows/sec  (batch size %d)' % (batched, batch_size))
+    print('speedup %.1fx' % (batched / single))
+    auth.close()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
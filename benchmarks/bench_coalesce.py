@@ -0,0 +1,89 @@
+"""Throughput of concurrent single-item POSTs with and without coalescing.
+
+    python -m benchmarks.bench_coalesce [--database-url URL] \\
+        [threads] [requests_per_thread]
+
+Each thread posts actors one at a time through its own test client, as
+the threads of a gunicorn gthread worker would. Prints rows/sec, request
+latency percentiles and the number of commits for each mode; the gain
+grows with the cost of a commit, so run it against postgres. Each mode
+writes to a throwaway sqlite file, or to --database-url, which must be a
+scratch database with empty tables.
+"""
+import argparse
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+
+from benchmarks.bench_batch import actor
+from benchmarks.common import LocalAuth, is_empty, make_app, percentile
+from models import db
+
+
+def run(auth, database_url, threads, requests, **config):
+    app = make_app(auth, database_url, **config)
+    commits = []
+    with app.app_context():
+        event.listen(db.get_engine(), 'commit',
+                     lambda conn: commits.append(1))
+    headers = auth.headers()
+    latencies = []
+    errors = []
+
+    def worker(offset):
+        client = app.test_client()
+        for i in range(offset, offset + requests):
+            start = time.perf_counter()
+            res = client.post('/actors', headers=headers, json=actor(i))
+            latencies.append(time.perf_counter() - start)
+            if res.status_code != 200:
+                errors.append(res.status_code)
+
+    workers = [threading.Thread(target=worker, args=(n * requests,))
+               for n in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rows_per_sec': threads * requests / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'commits': len(commits),
+        'errors': len(errors)
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.bench_coalesce')
+    parser.add_argument('--database-url')
+    parser.add_argument('threads', type=int, nargs='?', default=16)
+    parser.add_argument('requests', type=int, nargs='?', default=50)
+    options = parser.parse_args(argv)
+    auth = LocalAuth()
+    if options.database_url and \
+            not is_empty(make_app(auth, options.database_url)):
+        auth.close()
+        parser.error('the tables of --database-url are not empty')
+    args = (auth, options.database_url, options.threads, options.requests)
+    results = [
+        ('single', run(*args)),
+        ('coalesced', run(*args, WRITE_COALESCING=True))
+    ]
+    for name, result in results:
+        print('%-10s %8.0f rows/sec  p50 %7.2f ms  p99 %7.2f ms  '
+              '%5d commits  %d errors' % (
+                  name, result['rows_per_sec'], result['p50_ms'],
+                  result['p99_ms'], result['commits'], result['errors']))
+    print('speedup %.1fx' % (results[1][1]['rows_per_sec'] /
+                             results[0][1]['rows_per_sec']))
+    auth.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
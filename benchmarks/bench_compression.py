@@ -0,0 +1,51 @@
+"""Bytes on the wire and compression CPU per endpoint.
+
+    python -m benchmarks.bench_compression [actors] [movies]
+
+For a few GET endpoints prints the body size sent for each encoding, the
+CPU time of compressing it once (what a cache miss pays) and the latency
+of a cached response in that encoding (what a hit pays).
+"""
+import sys
+
+from benchmarks.common import LocalAuth, make_app, seed, timed
+
+URLS = [
+    '/actors?limit=1000',
+    '/movies?limit=1000',
+    '/movies?limit=200&include=cast',
+    '/search?q=sil&type=movies&limit=50',
+    '/stats/actors',
+]
+
+
+def main(actors=2000, movies=2000):
+    auth = LocalAuth()
+    app = make_app(auth)
+    seed(app, actors, movies)
+    client = app.test_client()
+    compressor = app.extensions['compressor']
+    headers = auth.headers()
+    for url in URLS:
+        plain = client.get(url, headers=dict(
+            headers, **{'Accept-Encoding': 'identity'})).data
+        print(url)
+        for encoding in ['identity'] + compressor.encodings:
+            request_headers = dict(headers, **{'Accept-Encoding': encoding})
+            res = client.get(url, headers=request_headers)
+            assert res.status_code == 200, res.status_code
+            cpu = 0.0
+            if encoding != 'identity' and len(plain) >= compressor.min_size:
+                cpu = timed(lambda: compressor.compress(plain, encoding), 20)
+            latency = timed(lambda: client.get(url, headers=request_headers),
+                            50)
+            print('  %-8s %9d bytes  %5.1f%%  compress %7.2f ms  '
+                  'request %6.2f ms' % (
+                      encoding, len(res.data),
+                      100.0 * len(res.data) / len(plain),
+                      cpu * 1000, latency * 1000))
+    auth.close()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
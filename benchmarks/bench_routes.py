@@ -0,0 +1,280 @@
+"""Scripted load against every route of create_app, saved as JSON.
+
+    python -m benchmarks.bench_routes [--actors N] [--movies N]
+        [--requests N] [--database-url URL] [--response-cache none]
+        [--out results.json]
+    python -m benchmarks.bench_routes --compare old.json new.json
+
+Runs offline: tokens are minted with a local RSA key (LocalAuth) and the
+tables are seeded into a throwaway sqlite file, or into --database-url,
+which must be a scratch database with empty tables: the delete and batch
+scripts delete rows by id.
+Each route of app.url_map gets ``--requests`` scripted calls through the
+test client; throughput and latency percentiles per route are printed and
+written to --out together with the commit and settings, so two runs can
+be diffed with --compare. A route without a script in SCRIPTS fails the
+run, so new endpoints have to be added here.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.common import (LocalAuth, is_empty, make_app, seed,
+                               insert_rows, fake_actor, fake_movie,
+                               percentile, WORDS)
+from models import db, movie_actors, Actors, Movies
+
+BATCH = 10
+REGRESSION = 0.10
+# /changes streams until this many seconds have passed; 0 sends what is
+# buffered and closes, which is the part worth timing. The in-process feed
+# is enough for a single process.
+CONFIG = {'CHANGES_STREAMING': True, 'CHANGES_FEED': 'memory',
+          'CHANGES_STREAM_SECONDS': 0}
+
+
+# Scripts
+#
+# script(ctx, i, spare) returns the path and JSON body of the i-th request.
+# Routes that consume rows (deletes) also have prepare(ctx, n), which adds
+# the rows beforehand; its result is passed as ``spare``.
+
+class Context:
+
+    def __init__(self, app, actor_ids, movie_ids):
+        self.app = app
+        self.actor_ids = actor_ids
+        self.movie_ids = movie_ids
+        self.rng = random.Random(11)
+
+    def actor(self, i):
+        return self.actor_ids[i % len(self.actor_ids)]
+
+    def movie(self, i):
+        return self.movie_ids[i % len(self.movie_ids)]
+
+    def spare_rows(self, model, fake, n):
+        with self.app.app_context():
+            return insert_rows(model.__table__,
+                               [fake(self.rng) for _ in range(n)])
+
+    def spare_cast(self, n):
+        actor_ids = self.spare_rows(Actors, fake_actor, n)
+        links = [{'movie_id': self.movie(i), 'actor_id': actor_id}
+                 for i, actor_id in enumerate(actor_ids)]
+        with self.app.app_context():
+            db.session.execute(movie_actors.insert(), links)
+            db.session.commit()
+        return links
+
+
+def movie_body(rng):
+    movie = fake_movie(rng)
+    movie['release_date'] = movie['release_date'].isoformat()
+    return movie
+
+
+def _batch(i):
+    return range(i * BATCH, (i + 1) * BATCH)
+
+
+SCRIPTS = {
+    'start_up': (lambda c, i, s: ('/', None), None),
+    'login': (lambda c, i, s: ('/login', None), None),
+    'get_pool_stats': (lambda c, i, s: ('/pool', None), None),
+    'get_metrics': (lambda c, i, s: ('/metrics', None), None),
+    'changes': (lambda c, i, s: ('/changes', None), None),
+    'get_actor_stats': (lambda c, i, s: ('/stats/actors', None), None),
+    'get_movie_stats': (lambda c, i, s: ('/stats/movies', None), None),
+    'get_actors': (lambda c, i, s: (
+        '/actors?limit=%d&min_age=%d' % (10 + i % 90, 18 + i % 40),
+        None), None),
+    'get_movies': (lambda c, i, s: (
+        '/movies?limit=%d&include=cast' % (10 + i % 90), None), None),
+    'get_actor_movies': (lambda c, i, s: (
+        '/actors/%d/movies' % c.actor(i), None), None),
+    'get_movie_cast': (lambda c, i, s: (
+        '/movies/%d/actors' % c.movie(i), None), None),
+    'search': (lambda c, i, s: (
+        '/search?q=%s&type=%s' % (WORDS[i % len(WORDS)][:3],
+                                  ('movies', 'actors')[i % 2]),
+        None), None),
+    'export_actors': (lambda c, i, s: ('/export/actors', None), None),
+    'export_movies': (lambda c, i, s: ('/export/movies', None), None),
+    'create_actors': (lambda c, i, s: (
+        '/actors', fake_actor(c.rng)), None),
+    'create_movies': (lambda c, i, s: ('/movies', movie_body(c.rng)), None),
+    'update_actors': (lambda c, i, s: (
+        '/actors/%d' % c.actor(i), {'age': 18 + i % 70}), None),
+    'update_movies': (lambda c, i, s: (
+        '/movies/%d' % c.movie(i), {'title': 'Retitled %d' % i}), None),
+    'delete_actors': (
+        lambda c, i, s: ('/actors/%d' % s[i], None),
+        lambda c, n: c.spare_rows(Actors, fake_actor, n)),
+    'delete_movies': (
+        lambda c, i, s: ('/movies/%d' % s[i], None),
+        lambda c, n: c.spare_rows(Movies, fake_movie, n)),
+    'create_actors_batch': (lambda c, i, s: (
+        '/actors:batch', [fake_actor(c.rng) for _ in _batch(i)]), None),
+    'create_movies_batch': (lambda c, i, s: (
+        '/movies:batch', [movie_body(c.rng) for _ in _batch(i)]), None),
+    'update_actors_batch': (lambda c, i, s: (
+        '/actors:batch', [{'id': c.actor(j), 'age': 18 + j % 70}
+                          for j in _batch(i)]), None),
+    'update_movies_batch': (lambda c, i, s: (
+        '/movies:batch', [{'id': c.movie(j), 'title': 'Batch %d' % j}
+                          for j in _batch(i)]), None),
+    'delete_actors_batch': (
+        lambda c, i, s: ('/actors:batch', s[i * BATCH:(i + 1) * BATCH]),
+        lambda c, n: c.spare_rows(Actors, fake_actor, n * BATCH)),
+    'delete_movies_batch': (
+        lambda c, i, s: ('/movies:batch', s[i * BATCH:(i + 1) * BATCH]),
+        lambda c, n: c.spare_rows(Movies, fake_movie, n * BATCH)),
+    'add_movie_cast': (lambda c, i, s: (
+        '/movies/%d/actors' % c.movie(i),
+        {'actor_ids': [c.actor(i + j) for j in range(3)]}), None),
+    'remove_movie_cast': (
+        lambda c, i, s: ('/movies/%d/actors/%d' % (
+            s[i]['movie_id'], s[i]['actor_id']), None),
+        lambda c, n: c.spare_cast(n)),
+}
+
+
+def routes(app):
+    """(method, rule, endpoint) of every route the app serves."""
+    found = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        if rule.endpoint not in SCRIPTS:
+            raise KeyError('no load script for %s %s' % (
+                rule.endpoint, rule.rule))
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            found.append((method, rule.rule, rule.endpoint))
+    return sorted(found, key=lambda route: (route[1], route[0]))
+
+
+# Running
+
+def run_route(client, ctx, headers, method, endpoint, requests):
+    script, prepare = SCRIPTS[endpoint]
+    spare = prepare(ctx, requests) if prepare else None
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for i in range(requests):
+        path, body = script(ctx, i, spare)
+        before = time.perf_counter()
+        res = client.open(path, method=method, headers=headers, json=body)
+        res.get_data()
+        latencies.append(time.perf_counter() - before)
+        res.close()
+        if res.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'requests_per_sec': requests / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': latencies[-1] * 1000
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(auth, app, options):
+    actor_ids, movie_ids = seed(app, options.actors, options.movies)
+    ctx = Context(app, actor_ids, movie_ids)
+    client = app.test_client()
+    headers = auth.headers()
+    results = {}
+    for method, rule, endpoint in routes(app):
+        name = '%s %s' % (method, rule)
+        results[name] = run_route(client, ctx, headers, method, endpoint,
+                                  options.requests)
+        print('%-50s %9.1f req/s  p50 %7.2f ms  p99 %7.2f ms  errors %d' % (
+            name, results[name]['requests_per_sec'],
+            results[name]['p50_ms'], results[name]['p99_ms'],
+            results[name]['errors']))
+    auth.close()
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'settings': {
+            'actors': options.actors,
+            'movies': options.movies,
+            'requests': options.requests,
+            'database': app.config['DATABASE_URL'].split(':')[0],
+            'response_cache': options.response_cache
+        },
+        'routes': results
+    }
+    with open(options.out, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('results written to', options.out)
+
+
+def compare(old_path, new_path, threshold=REGRESSION):
+    """Print the change per route; returns the routes that got slower."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print('%s -> %s' % (old['commit'], new['commit']))
+    regressions = []
+    for name, after in sorted(new['routes'].items()):
+        before = old['routes'].get(name)
+        if before is None:
+            print('%-50s new route' % name)
+            continue
+        change = after['p50_ms'] / before['p50_ms'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('%-50s p50 %7.2f -> %7.2f ms (%+.0f%%)%s' % (
+            name, before['p50_ms'], after['p50_ms'], change * 100, flag))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.bench_routes')
+    parser.add_argument('--actors', type=int, default=1000)
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--database-url')
+    parser.add_argument('--response-cache', default='memory',
+                        choices=['memory', 'none'])
+    parser.add_argument('--out', default='bench_routes.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    options = parser.parse_args(argv)
+    if options.compare:
+        return 1 if compare(*options.compare) else 0
+    auth = LocalAuth()
+    app = make_app(auth, options.database_url, **dict(
+        CONFIG, RESPONSE_CACHE_BACKEND=options.response_cache))
+    if not is_empty(app):
+        auth.close()
+        parser.error('the tables of --database-url are not empty')
+    run(auth, app, options)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,77 @@
+"""Search latency as the movie table grows.
+
+    python -m benchmarks.bench_search [--database-url URL] [rows ...]
+
+Grows the table to each size (default 10k, 100k, 1M) and times Movies.search
+for random prefix, substring and misspelled terms. On postgres the trigram
+index keeps latency roughly flat; the sqlite fallback scans the table.
+Rows go into a throwaway sqlite file, or into --database-url, which must
+point at a scratch database whose movies table is empty: nothing is ever
+dropped or deleted.
+"""
+import argparse
+import random
+import sys
+import time
+
+from benchmarks.common import LocalAuth, make_app, percentile
+from models import db, Movies
+
+WORDS = ['alien', 'heat', 'matrix', 'river', 'night', 'garden', 'shadow',
+         'empire', 'storm', 'harbor', 'silver', 'winter', 'paper', 'ghost']
+
+
+def title(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(3)) + ' %d' % rng.random()
+
+
+def grow(rng, current, target):
+    table = Movies.__table__
+    for offset in range(current, target, 10000):
+        db.session.execute(table.insert(), [
+            {'title': title(rng), 'release_date': None}
+            for _ in range(offset, min(target, offset + 10000))
+        ])
+    db.session.commit()
+
+
+def terms(rng):
+    word = rng.choice(WORDS)
+    misspelled = word[:2] + word[3:]
+    return [word[:3], word[1:4] + ' ' + rng.choice(WORDS)[:2], misspelled]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.bench_search')
+    parser.add_argument('--database-url')
+    parser.add_argument('sizes', type=int, nargs='*',
+                        default=[10000, 100000, 1000000])
+    options = parser.parse_args(argv)
+    rng = random.Random(7)
+    auth = LocalAuth()
+    app = make_app(auth, options.database_url)
+    with app.test_request_context():
+        if Movies.query.limit(1).count():
+            auth.close()
+            parser.error('the movies table of --database-url is not empty')
+        current = 0
+        for size in options.sizes:
+            grow(rng, current, size)
+            current = size
+            if db.engine.name == 'postgresql':
+                db.session.execute('ANALYZE movies')
+            latencies = []
+            for _ in range(100):
+                for term in terms(rng):
+                    start = time.perf_counter()
+                    Movies.search(term, 20)
+                    latencies.append(time.perf_counter() - start)
+            latencies.sort()
+            print('%8d rows  p50 %7.2f ms  p99 %7.2f ms' % (
+                size, percentile(latencies, 50) * 1000,
+                percentile(latencies, 99) * 1000))
+    auth.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
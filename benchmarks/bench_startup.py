@@ -0,0 +1,71 @@
+"""Worker startup cost: import, create_app and the first requests.
+
+    [DATABASE_URL=postgresql://...] python -m benchmarks.bench_startup [runs]
+
+Every run is a fresh interpreter, as a newly spawned gunicorn worker would
+be. It times importing app.py, create_app() and the first and second
+authenticated GET /actors, once without and once with WARM_UP, which
+moves the pool connections and the JWKS fetch from the first request into
+create_app().
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def child(database_url, jwks_url, token, warm_up):
+    start = time.perf_counter()
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app({
+        'DATABASE_URL': database_url,
+        'JWKS_URL': jwks_url,
+        'WARM_UP': warm_up == '1',
+        'DEBUG': False
+    })
+    created = time.perf_counter()
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + token}
+    timings = {'import': imported - start, 'create_app': created - imported}
+    for name in ('first_request', 'second_request'):
+        before = time.perf_counter()
+        res = client.get('/actors', headers=headers)
+        assert res.status_code == 200, res.status_code
+        timings[name] = time.perf_counter() - before
+    print(json.dumps(timings))
+
+
+def run(database_url, auth, token, warm_up):
+    out = subprocess.check_output([
+        sys.executable, '-m', 'benchmarks.bench_startup', '--child',
+        database_url, auth.jwks_url, token, warm_up])
+    return json.loads(out.decode().splitlines()[-1])
+
+
+def main(runs=10):
+    # imported here so that the child processes time the import of app.py
+    from benchmarks.common import LocalAuth, make_app, percentile
+    auth = LocalAuth()
+    app = make_app(auth, os.environ.get('DATABASE_URL'))
+    database_url = app.config['DATABASE_URL']
+    token = auth.token()
+    for warm_up in ('0', '1'):
+        samples = [run(database_url, auth, token, warm_up)
+                   for _ in range(runs)]
+        print('WARM_UP=%s' % warm_up)
+        for name in ('import', 'create_app', 'first_request',
+                     'second_request'):
+            values = sorted(sample[name] for sample in samples)
+            print('  %-15s p50 %8.1f ms   p90 %8.1f ms' % (
+                name, percentile(values, 50) * 1000,
+                percentile(values, 90) * 1000))
+    auth.close()
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(*sys.argv[2:])
+    else:
+        main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,66 @@
+"""Actor statistics: full scan against the stats_summary table.
+
+    python -m benchmarks.bench_stats [--database-url URL] [rows ...]
+
+For each table size (default 10k and 100k actors) times computing the
+counts from Actors.query.all() in Python, as reporting clients do today,
+one refresh of the summary (GROUP BY queries) and a warm GET /stats/actors,
+which only reads the summary rows. Rows go into a throwaway sqlite file,
+or into --database-url, which must be a scratch database with empty
+tables.
+"""
+import argparse
+import sys
+import time
+from collections import Counter
+
+from benchmarks.common import LocalAuth, is_empty, make_app, seed, timed
+from models import db, Actors
+from stats import refresh_stats
+
+
+def scan():
+    actors = Actors.query.all()
+    return (len(actors), Counter(actor.gender for actor in actors),
+            Counter(actor.age // 10 for actor in actors))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog='benchmarks.bench_stats')
+    parser.add_argument('--database-url')
+    parser.add_argument('sizes', type=int, nargs='*',
+                        default=[10000, 100000])
+    options = parser.parse_args(argv)
+    auth = LocalAuth()
+    app = make_app(auth, options.database_url)
+    if not is_empty(app):
+        auth.close()
+        parser.error('the tables of --database-url are not empty')
+    client = app.test_client()
+    headers = auth.headers()
+    current = 0
+    for size in options.sizes:
+        seed(app, actors=size - current, movies=0)
+        current = size
+        with app.app_context():
+            scan_time = timed(scan, 3)
+            db.session.remove()
+            start = time.perf_counter()
+            refresh_stats('actors')
+            refresh_time = time.perf_counter() - start
+
+        def request():
+            res = client.get('/stats/actors', headers=headers)
+            assert res.status_code == 200, res.status_code
+
+        request()
+        summary_time = timed(request, 200)
+        print('%8d actors  scan %8.1f ms  refresh %7.1f ms  '
+              '/stats %6.2f ms  (%.0fx)' % (
+                  size, scan_time * 1000, refresh_time * 1000,
+                  summary_time * 1000, scan_time / summary_time))
+    auth.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
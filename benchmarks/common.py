@@ -0,0 +1,168 @@
+import base64
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+
+import rsa
+from jose import jwt
+
+from app import create_app
+from models import db, movie_actors, Actors, Movies
+
+ISSUER = 'https://cshop.auth0.com/'
+AUDIENCE = 'capstone'
+ALL_PERMISSIONS = [
+    'get:actors', 'get:movies',
+    'post:actors', 'post:movies',
+    'patch:actors', 'patch:movies',
+    'delete:actors', 'delete:movies'
+]
+
+
+def _b64(number):
+    raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+class LocalAuth:
+    """Local stand-in for Auth0: an RSA key pair published as a JWKS file."""
+
+    def __init__(self, kid='bench-key', bits=2048):
+        self.kid = kid
+        public, private = rsa.newkeys(bits)
+        self.private_pem = private.save_pkcs1().decode('ascii')
+        self.jwks = {'keys': [{
+            'kty': 'RSA',
+            'kid': kid,
+            'use': 'sig',
+            'alg': 'RS256',
+            'n': _b64(public.n),
+            'e': _b64(public.e)
+        }]}
+        fd, self.jwks_path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.jwks, f)
+
+    @property
+    def jwks_url(self):
+        return 'file://' + self.jwks_path
+
+    def token(self, permissions=ALL_PERMISSIONS, sub='auth0|bench', ttl=3600):
+        now = int(time.time())
+        claims = {
+            'iss': ISSUER,
+            'sub': sub,
+            'aud': AUDIENCE,
+            'iat': now,
+            'exp': now + ttl,
+            'permissions': list(permissions)
+        }
+        return jwt.encode(claims, self.private_pem, algorithm='RS256',
+                          headers={'kid': self.kid})
+
+    def headers(self, permissions=ALL_PERMISSIONS, **kwargs):
+        return {'Authorization': 'Bearer ' + self.token(permissions, **kwargs)}
+
+    def close(self):
+        os.remove(self.jwks_path)
+
+
+def make_app(auth, database_url=None, **config):
+    if database_url is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = 'sqlite:///' + path
+    test_config = {
+        'DATABASE_URL': database_url,
+        'JWKS_URL': auth.jwks_url,
+        'DEBUG': False
+    }
+    test_config.update(config)
+    app = create_app(test_config)
+    # the app no longer creates tables itself, migrations do in production
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+# Seeding
+
+WORDS = ['alien', 'heat', 'matrix', 'river', 'night', 'garden', 'shadow',
+         'empire', 'storm', 'harbor', 'silver', 'winter', 'paper', 'ghost']
+
+
+def fake_actor(rng):
+    return {
+        'name': '%s %s' % (rng.choice(WORDS).title(),
+                           rng.choice(WORDS).title()),
+        'age': rng.randint(18, 90),
+        'gender': rng.choice('FM')
+    }
+
+
+def fake_movie(rng):
+    return {
+        'title': ' '.join(rng.choice(WORDS) for _ in range(3)).title(),
+        'release_date': datetime.date(1950, 1, 1) + datetime.timedelta(
+            days=rng.randint(0, 365 * 75))
+    }
+
+
+def insert_rows(table, rows, chunk=10000):
+    """Insert ``rows`` into ``table`` and return the new ids in order.
+
+    Needs an app context and a table nobody else is writing to.
+    """
+    before = db.session.query(db.func.max(table.c.id)).scalar() or 0
+    for offset in range(0, len(rows), chunk):
+        db.session.execute(table.insert(), rows[offset:offset + chunk])
+    db.session.commit()
+    return [row.id for row in db.session.query(table.c.id).filter(
+        table.c.id > before).order_by(table.c.id)]
+
+
+def is_empty(app):
+    """Whether the actors and movies tables of ``app`` hold no rows; only
+    seed a database that is, so live data is never mixed with fake rows."""
+    with app.app_context():
+        return not (db.session.query(Actors.id).limit(1).count() or
+                    db.session.query(Movies.id).limit(1).count())
+
+
+def seed(app, actors=1000, movies=1000, cast=3, rng=None):
+    """Add ``actors`` actors and ``movies`` movies with ``cast`` actors
+    each. Returns the (actor_ids, movie_ids) that were added."""
+    rng = rng or random.Random(7)
+    with app.app_context():
+        actor_ids = insert_rows(Actors.__table__,
+                                [fake_actor(rng) for _ in range(actors)])
+        movie_ids = insert_rows(Movies.__table__,
+                                [fake_movie(rng) for _ in range(movies)])
+        links = []
+        for movie_id in movie_ids:
+            for actor_id in rng.sample(actor_ids, min(cast, len(actor_ids))):
+                links.append({'movie_id': movie_id, 'actor_id': actor_id})
+        for offset in range(0, len(links), 10000):
+            db.session.execute(movie_actors.insert(),
+                               links[offset:offset + 10000])
+        db.session.commit()
+    return actor_ids, movie_ids
+
+
+# Measuring
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
@@ -0,0 +1,315 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime
+
+import click
+
+from export import ndjson_lines
+from models import db, after_commit, Actors, Movies
+from validation import clean_actor, clean_movie
+
+MODELS = {
+    'actors': (Actors, clean_actor),
+    'movies': (Movies, clean_movie)
+}
+
+FORMATS = ('csv', 'ndjson')
+
+
+# Bulk import and export
+#
+# `flask import` and `flask export` move whole tables in CSV or NDJSON. On
+# postgres rows go through COPY, which skips the per-statement overhead of
+# INSERT and the ORM entirely; other databases get batched INSERTs and a
+# server-side cursor instead. Input is read, validated and written
+# ``chunk_size`` rows at a time, each chunk in its own transaction.
+
+def file_format(path, fmt=None):
+    """``fmt``, or the format named by the extension of ``path``."""
+    if fmt is not None:
+        return fmt
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    raise click.BadParameter('cannot tell the format of %s, use --format'
+                             % path)
+
+
+def _is_postgres():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+# Import
+
+def read_items(stream, fmt):
+    """Yield ``(line, item)`` for each record of ``stream``; ``item`` is
+    None when the line is not valid JSON."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for item in reader:
+            yield reader.line_num, item
+        return
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except ValueError:
+            yield line, None
+
+
+def clean_row(item, clean):
+    """``(values, errors)`` as the POST handlers see them, plus an optional
+    integer ``id`` so exported rows keep their ids."""
+    values, errors = clean(item)
+    row_id = item.get('id') if isinstance(item, dict) else None
+    if row_id not in (None, ''):
+        try:
+            if isinstance(row_id, (bool, float)):
+                raise ValueError
+            values['id'] = int(row_id)
+        except (TypeError, ValueError):
+            errors.append('id is invalid')
+    return values, errors
+
+
+def _copy_in(table, rows):
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if row[c] is None else row[c] for c in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (
+        table.name, ', '.join(columns)), buffer)
+
+
+def write_chunk(table, rows, copy):
+    """Insert ``rows`` in one transaction, through COPY when ``copy``."""
+    now = datetime.utcnow()
+    groups = {}
+    for row in rows:
+        row['updated_at'] = now
+        # COPY and executemany need the same columns in every row
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    for group in groups.values():
+        if copy:
+            _copy_in(table, group)
+        else:
+            db.session.execute(table.insert(), group)
+    db.session.commit()
+
+
+def import_file(name, path, fmt=None, chunk_size=10000):
+    """Import one file into table ``name``; returns ``(rows, rejected)``.
+
+    Rejected records are reported on stderr with their line number and do
+    not stop the import.
+    """
+    model, clean = MODELS[name]
+    fmt = file_format(path, fmt)
+    copy = _is_postgres()
+    rows = []
+    count = rejected = 0
+    with open(path, newline='', encoding='utf-8') as stream:
+        for line, item in read_items(stream, fmt):
+            if item is None:
+                values, errors = {}, ['invalid JSON']
+            else:
+                values, errors = clean_row(item, clean)
+            if errors:
+                rejected += 1
+                click.echo('%s:%d: %s' % (path, line, ', '.join(errors)),
+                           err=True)
+                continue
+            rows.append(values)
+            if len(rows) >= chunk_size:
+                write_chunk(model.__table__, rows, copy)
+                count += len(rows)
+                rows = []
+    if rows:
+        write_chunk(model.__table__, rows, copy)
+        count += len(rows)
+    return count, rejected
+
+
+def reset_sequence(name):
+    """Move the id sequence past ids that were imported explicitly."""
+    if _is_postgres():
+        db.session.execute(
+            "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+            "coalesce(max(id), 1)) FROM %s" % name, {'table': name})
+        db.session.commit()
+
+
+# Export
+
+def _columns(name):
+    return [column.key for column in MODELS[name][0].format_columns()]
+
+
+def _select_sql(name, low, high):
+    sql = 'SELECT %s FROM %s' % (', '.join(_columns(name)), name)
+    if low is not None:
+        sql += ' WHERE id BETWEEN %d AND %d' % (low, high)
+    return sql + ' ORDER BY id'
+
+
+def _copy_out(name, fmt, stream, low, high):
+    sql = _select_sql(name, low, high)
+    if fmt == 'csv':
+        copy = 'COPY (%s) TO STDOUT WITH (FORMAT csv, HEADER)' % sql
+    else:
+        # one JSON document per row; quote and delimiter characters that
+        # never occur in JSON keep COPY from escaping or quoting it
+        copy = ("COPY (SELECT row_to_json(t) FROM (%s) t) TO STDOUT "
+                "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+                % sql)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(copy, stream)
+
+
+def _fetch_out(name, fmt, stream, low, high, batch_size):
+    model = MODELS[name][0]
+    query = model.query.with_entities(*model.format_columns())
+    if low is not None:
+        query = query.filter(model.id.between(low, high))
+    query = query.order_by(model.id)
+    if fmt == 'ndjson':
+        for chunk in ndjson_lines(query, batch_size):
+            stream.write(chunk)
+        return
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(_columns(name))
+    rows = query.execution_options(stream_results=True).yield_per(batch_size)
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+    text.detach()
+
+
+def export_file(name, path, fmt=None, low=None, high=None,
+                batch_size=1000):
+    """Write table ``name`` (ids ``low`` to ``high`` when given) to
+    ``path``; returns the number of rows written."""
+    fmt = file_format(path, fmt)
+    model = MODELS[name][0]
+    query = db.session.query(db.func.count(model.id))
+    if low is not None:
+        query = query.filter(model.id.between(low, high))
+    count = query.scalar()
+    with open(path, 'wb') as stream:
+        if _is_postgres():
+            _copy_out(name, fmt, stream, low, high)
+        else:
+            _fetch_out(name, fmt, stream, low, high, batch_size)
+    db.session.rollback()
+    return count
+
+
+def id_ranges(name, parts):
+    """Split the ids of table ``name`` into ``parts`` (low, high) ranges."""
+    model = MODELS[name][0]
+    low, high = db.session.query(
+        db.func.min(model.id), db.func.max(model.id)).one()
+    if low is None:
+        return [(0, 0)]
+    step = (high - low) // parts + 1
+    return [(start, min(high, start + step - 1))
+            for start in range(low, high + 1, step)]
+
+
+def part_path(path, index):
+    """``actors.csv`` -> ``actors.0.csv``."""
+    root, ext = os.path.splitext(path)
+    return '%s.%d%s' % (root, index, ext)
+
+
+# Worker processes
+#
+# Each worker is a forked copy of the CLI process. The parent closes its
+# pooled connections first so that every worker opens its own.
+
+_app = None
+
+
+def _in_worker(task):
+    function, args = task
+    with _app.app_context():
+        try:
+            return function(*args)
+        finally:
+            db.session.remove()
+
+
+def run_tasks(app, function, tasks, workers):
+    """``[function(*args) for args in tasks]``, on ``workers`` processes."""
+    global _app
+    if workers <= 1 or len(tasks) <= 1:
+        return [function(*args) for args in tasks]
+    _app = app
+    db.session.remove()
+    db.get_engine().dispose()
+    context = multiprocessing.get_context('fork')
+    with context.Pool(min(workers, len(tasks))) as pool:
+        return pool.map(_in_worker, [(function, args) for args in tasks])
+
+
+def _report(action, name, rows, seconds):
+    click.echo('%s %d %s in %.1fs (%.0f rows/sec)' % (
+        action, rows, name, seconds, rows / seconds if seconds else 0))
+
+
+def setup_bulk_commands(app):
+    """Register ``flask import`` and ``flask export``."""
+
+    @app.cli.command('import')
+    @click.argument('table', type=click.Choice(sorted(MODELS)))
+    @click.argument('paths', nargs=-1, required=True,
+                    type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS),
+                  help='Input format, by default from the file extension.')
+    @click.option('--workers', default=1,
+                  help='Files imported in parallel, e.g. one per id range.')
+    @click.option('--chunk-size', default=app.config['IMPORT_CHUNK_SIZE'],
+                  help='Rows validated and written per transaction.')
+    def import_command(table, paths, fmt, workers, chunk_size):
+        """Load actors or movies from CSV or NDJSON files."""
+        start = time.perf_counter()
+        results = run_tasks(app, import_file, [
+            (table, path, fmt, chunk_size) for path in paths], workers)
+        reset_sequence(table)
+        after_commit(table, 'create', [])
+        rows = sum(result[0] for result in results)
+        rejected = sum(result[1] for result in results)
+        _report('imported', table, rows, time.perf_counter() - start)
+        if rejected:
+            raise click.ClickException('%d rows rejected' % rejected)
+
+    @app.cli.command('export')
+    @click.argument('table', type=click.Choice(sorted(MODELS)))
+    @click.argument('path', type=click.Path(dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS),
+                  help='Output format, by default from the file extension.')
+    @click.option('--workers', default=1,
+                  help='Write one file per id range, in parallel.')
+    def export_command(table, path, fmt, workers):
+        """Write every actor or movie to a CSV or NDJSON file."""
+        start = time.perf_counter()
+        batch_size = app.config['EXPORT_BATCH_SIZE']
+        if workers > 1:
+            tasks = [(table, part_path(path, index), fmt, low, high,
+                      batch_size)
+                     for index, (low, high) in enumerate(
+                         id_ranges(table, workers))]
+        else:
+            tasks = [(table, path, fmt, None, None, batch_size)]
+        rows = sum(run_tasks(app, export_file, tasks, workers))
+        _report('exported', table, rows, time.perf_counter() - start)
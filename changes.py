@@ -0,0 +1,170 @@
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from models import on_write
+from serialization import dumps
+
+# Table whose events a caller may see -> permission needed to read it
+TABLE_PERMISSIONS = {
+    'actors': 'get:actors',
+    'movies': 'get:movies',
+    'movie_actors': 'get:movies'
+}
+
+
+# Feeds
+#
+# A feed keeps the last ``size`` events. read(after_id, timeout) waits up
+# to ``timeout`` seconds for events newer than ``after_id`` and returns
+# ``(events, lost)``: ``events`` is a list of (id, table, data) and
+# ``lost`` is True when events after ``after_id`` were already dropped.
+
+class MemoryFeed:
+    """Per-process feed, the default."""
+
+    def __init__(self, size=1000):
+        self._events = deque(maxlen=size)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    def publish(self, table, data):
+        with self._cond:
+            self._last_id += 1
+            self._events.append((str(self._last_id), table, data))
+            self._cond.notify_all()
+
+    def last_id(self):
+        return str(self._last_id)
+
+    def read(self, after_id, timeout):
+        try:
+            after = int(after_id)
+        except ValueError:
+            return [], True
+        with self._cond:
+            if after > self._last_id or (
+                    self._events and after < int(self._events[0][0]) - 1):
+                return [], True
+            self._cond.wait_for(lambda: self._last_id > after, timeout)
+            return [event for event in self._events
+                    if int(event[0]) > after], False
+
+
+STREAM_ID = re.compile(r'(\d+)(?:-(\d+))?', re.ASCII)
+
+
+def stream_id(entry_id):
+    """``'1526919030474-55'`` -> ``(1526919030474, 55)``; ValueError for
+    anything redis would not take as a stream entry id."""
+    match = STREAM_ID.fullmatch(entry_id)
+    if match is None:
+        raise ValueError(entry_id)
+    parts = int(match.group(1)), int(match.group(2) or 0)
+    if max(parts) >= 2 ** 64:
+        raise ValueError(entry_id)
+    return parts
+
+
+class RedisFeed:
+    """Feed on a redis stream, shared by every worker.
+
+    ``client`` is anything with the redis-py stream API. Event ids are the
+    stream's entry ids. Entry ids are not consecutive, so a client whose
+    last id is older than the oldest entry still in the stream is taken to
+    have lost events; ``'0-0'``, the id of an empty stream, never is.
+    """
+
+    def __init__(self, client, key='capstone:changes', size=1000):
+        self.client = client
+        self.key = key
+        self.size = size
+
+    @classmethod
+    def from_url(cls, url, size=1000):
+        import redis
+        return cls(redis.Redis.from_url(url), size=size)
+
+    def publish(self, table, data):
+        self.client.xadd(self.key, {'table': table, 'data': data},
+                         maxlen=self.size, approximate=True)
+
+    def last_id(self):
+        entries = self.client.xrevrange(self.key, count=1)
+        return entries[0][0].decode() if entries else '0-0'
+
+    def read(self, after_id, timeout):
+        try:
+            after = stream_id(after_id)
+        except ValueError:
+            return [], True
+        oldest = self.client.xrange(self.key, count=1)
+        if oldest and after != (0, 0) and \
+                after < stream_id(oldest[0][0].decode()):
+            return [], True
+        streams = self.client.xread({self.key: after_id}, count=100,
+                                    block=max(1, int(timeout * 1000)))
+        events = []
+        for _, entries in streams or ():
+            for entry_id, fields in entries:
+                events.append((entry_id.decode(), fields[b'table'].decode(),
+                               fields[b'data']))
+        return events, False
+
+
+def make_feed(kind, url=None, size=1000):
+    """A RedisFeed for the ``'redis'`` backend, else a MemoryFeed."""
+    if kind == 'redis':
+        return RedisFeed.from_url(url, size)
+    return MemoryFeed(size)
+
+
+# Server-sent events
+
+def event_stream(feed, tables, after_id=None, heartbeat=15, duration=300,
+                 clock=time.monotonic):
+    """Yield the SSE frames of the events on ``tables`` after ``after_id``
+    (the newest event when None) for ``duration`` seconds."""
+    deadline = clock() + duration
+    if after_id is None:
+        after_id = feed.last_id()
+    yield b'retry: 1000\n\n'
+    while True:
+        remaining = max(0, deadline - clock())
+        events, lost = feed.read(after_id, min(heartbeat, remaining))
+        if lost:
+            after_id = feed.last_id()
+            yield b''.join([b'id: ', after_id.encode(),
+                            b'\nevent: reset\ndata: {}\n\n'])
+        elif not events:
+            yield b': keepalive\n\n'
+        for event_id, table, data in events:
+            after_id = event_id
+            if table in tables:
+                yield b''.join([b'id: ', event_id.encode(),
+                                b'\nevent: change\ndata: ', data, b'\n\n'])
+        if clock() >= deadline:
+            return
+
+
+def setup_changes(app):
+    """Publish every committed write to the app's change feed; None when
+    CHANGES_STREAMING is off."""
+    if not app.config['CHANGES_STREAMING']:
+        return None
+    feed = make_feed(app.config['CHANGES_FEED'],
+                     app.config['RESPONSE_CACHE_URL'],
+                     app.config['CHANGES_BUFFER'])
+    app.extensions['changes'] = feed
+
+    def publish(table, op, ids):
+        feed.publish(table, dumps({
+            'table': table,
+            'op': op,
+            'ids': ids,
+            'at': datetime.utcnow()
+        }))
+    on_write(app, publish)
+    return feed
@@ -0,0 +1,124 @@
+import threading
+
+from models import db, after_commit, _affected_id, _parse_id
+
+
+# Group commit
+#
+# Concurrent single-row writes are queued for up to ``window`` seconds (or
+# until ``max_items`` are waiting) and written in one transaction, so they
+# share a commit instead of each paying for its own. The first request of a
+# batch leads it: it waits out the window, runs every write of the batch on
+# its own session and wakes the others with their results.
+
+class _Write:
+
+    def __init__(self, apply):
+        self.apply = apply
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _Batch:
+
+    def __init__(self):
+        self.writes = []
+        self.full = threading.Event()
+
+
+class WriteCoalescer:
+    """Writes concurrent inserts and updates in shared transactions.
+
+    Each caller gets the result of its own write, as Model.insert() and
+    Model.update_by_id() would give it, or the exception its write raised;
+    a write that fails does not fail the others of its batch.
+    """
+
+    def __init__(self, window=0.005, max_items=100):
+        self.window = window
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._batch = None
+
+    def insert(self, model, values):
+        """INSERT a ``model`` row; returns its id."""
+        table = model.__table__
+
+        def apply():
+            result = db.session.execute(table.insert().values(**values))
+            return (table.name, 'create', result.inserted_primary_key[0])
+        return self._submit(apply)
+
+    def update(self, model, row_id, values):
+        """UPDATE the ``model`` row ``row_id``; returns None when there is
+        no such row."""
+        row_id = _parse_id(row_id)
+        if row_id is None:
+            return None
+        table = model.__table__
+        stmt = table.update().where(table.c.id == row_id).values(**values)
+
+        def apply():
+            return (table.name, 'update', _affected_id(stmt, table, row_id))
+        return self._submit(apply)
+
+    def _submit(self, apply):
+        write = _Write(apply)
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            batch.writes.append(write)
+            if len(batch.writes) >= self.max_items:
+                self._batch = None
+                batch.full.set()
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            try:
+                self._flush(batch.writes)
+            finally:
+                for other in batch.writes:
+                    other.done.set()
+        else:
+            write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result[2]
+
+    def _flush(self, writes):
+        try:
+            for write in writes:
+                write.result = write.apply()
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            if len(writes) == 1:
+                writes[0].result = None
+                writes[0].error = error
+                return
+            # find the failing writes by committing each on its own
+            for write in writes:
+                self._flush([write])
+            return
+        written = {}
+        for write in writes:
+            table, op, row_id = write.result
+            if row_id is not None:
+                written.setdefault((table, op), []).append(row_id)
+        for (table, op), ids in written.items():
+            after_commit(table, op, ids)
+
+
+def setup_coalescer(app):
+    """The app's WriteCoalescer, or None when WRITE_COALESCING is off."""
+    if not app.config['WRITE_COALESCING']:
+        return None
+    coalescer = WriteCoalescer(app.config['WRITE_COALESCE_WINDOW'],
+                               app.config['WRITE_COALESCE_MAX'])
+    app.extensions['coalescer'] = coalescer
+    return coalescer
@@ -0,0 +1,73 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('application/json', 'text/plain', 'text/html')
+
+
+class Compressor:
+    """Picks and applies the Content-Encoding of a response.
+
+    brotli is offered when the package is installed, gzip always; the
+    client's Accept-Encoding decides between them. Bodies shorter than
+    ``min_size`` are sent as they are.
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def accepted(self):
+        """The encoding the current request prefers, or None."""
+        return request.accept_encodings.best_match(self.encodings)
+
+    def negotiate(self, mimetype):
+        """The encoding the current request accepts for ``mimetype``."""
+        if mimetype not in COMPRESSIBLE:
+            return None
+        return self.accepted()
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        # mtime=0 so the same body always compresses to the same bytes
+        return gzip.compress(body, self.gzip_level, mtime=0)
+
+
+def setup_compression(app):
+    """Compress the app's responses; cached ones are compressed by the
+    ResponseCache, which keeps the compressed bytes."""
+    compressor = Compressor(app.config['COMPRESSION_MIN_SIZE'],
+                            app.config['COMPRESSION_GZIP_LEVEL'],
+                            app.config['COMPRESSION_BROTLI_QUALITY'])
+    app.extensions['compressor'] = compressor
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype in COMPRESSIBLE:
+            response.vary.add('Accept-Encoding')
+        if response.status_code != 200 or response.is_streamed or \
+                response.direct_passthrough or \
+                'Content-Encoding' in response.headers:
+            return response
+        encoding = compressor.negotiate(response.mimetype)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < compressor.min_size:
+            return response
+        response.set_data(compressor.compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(etag + '-' + encoding, weak)
+        return response
+
+    return compressor
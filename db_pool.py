@@ -0,0 +1,94 @@
+import os
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+
+# Connection pool
+#
+# Every gunicorn worker holds one engine with up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so postgres needs
+# max_connections >= dynos * workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.waits += 1
+            self.wait_time += elapsed
+            self.max_wait = max(self.max_wait, elapsed)
+
+
+@event.listens_for(TimedQueuePool, 'connect')
+def _remember_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+
+@event.listens_for(TimedQueuePool, 'checkout')
+def _reconnect_after_fork(dbapi_connection, connection_record,
+                          connection_proxy):
+    # A connection opened before gunicorn forked belongs to the master;
+    # drop it from this worker's pool instead of sharing the socket.
+    if connection_record.info['pid'] != os.getpid():
+        connection_record.connection = connection_proxy.connection = None
+        raise exc.DisconnectionError(
+            'connection belongs to pid %s' % connection_record.info['pid'])
+
+
+def engine_options(config, database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for ``database_uri`` from the app config."""
+    if make_url(database_uri).drivername.startswith('sqlite'):
+        return {}
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING']
+    }
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    if timeout:
+        options['connect_args'] = {
+            'options': '-c statement_timeout=%d' % timeout
+        }
+    return options
+
+
+def warm_pool(engine, connections):
+    """Open ``connections`` connections now and leave them in the pool."""
+    opened = [engine.connect() for _ in range(connections)]
+    for conn in opened:
+        conn.close()
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__, 'pid': os.getpid()}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': max(0, pool.overflow())
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update({
+            'waits': pool.waits,
+            'wait_time': pool.wait_time,
+            'max_wait': pool.max_wait
+        })
+    return stats
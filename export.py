@@ -0,0 +1,32 @@
+from flask import Response, stream_with_context
+
+from serialization import dumps
+
+
+# NDJSON streaming export
+
+
+def ndjson_lines(query, batch_size):
+    """Yield the rows of a column-only query as NDJSON, one batch at a time.
+
+    The query runs on a server-side cursor and rows come back as plain
+    tuples, so only ``batch_size`` rows are held in memory at once.
+    """
+    names = [column['name'] for column in query.column_descriptions]
+    query = query.execution_options(stream_results=True).yield_per(batch_size)
+    lines = []
+    for row in query:
+        lines.append(dumps(dict(zip(names, row))))
+        if len(lines) >= batch_size:
+            lines.append(b'')
+            yield b'\n'.join(lines)
+            lines = []
+    if lines:
+        lines.append(b'')
+        yield b'\n'.join(lines)
+
+
+def ndjson_response(query, batch_size):
+    return Response(
+        stream_with_context(ndjson_lines(query, batch_size)),
+        mimetype='application/x-ndjson')
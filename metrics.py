@@ -0,0 +1,175 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Per-request timing
+
+@contextmanager
+def span(name):
+    """Time a stage of the current request into its Server-Timing header.
+
+    Outside of a request this does nothing, so the instrumented helpers can
+    still be called from scripts and tests.
+    """
+    if not has_request_context() or 'timings' not in g:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        g.timings[name] = g.timings.get(name, 0.0) + elapsed
+
+
+# Start times are keyed by execution context rather than stacked, so a
+# statement that fails (and never reaches after_cursor_execute) cannot
+# shift the timings of the ones after it; handle_error drops its entry.
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault('query_start', {})[context] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, many):
+    start = conn.info.get('query_start', {}).pop(context, None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    if has_request_context() and 'timings' in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _query_failed(exception_context):
+    conn = exception_context.connection
+    if conn is not None and not (conn.closed or conn.invalidated):
+        conn.info.get('query_start', {}).pop(
+            exception_context.execution_context, None)
+
+
+# Prometheus metrics
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    """Per-process registry behind the /metrics endpoint."""
+
+    def __init__(self):
+        self.latency = {}
+        self.db_queries = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method, route, seconds, queries):
+        key = (method, route)
+        with self._lock:
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+            self.db_queries[key] = self.db_queries.get(key, 0) + queries
+
+    def inc(self, name, labels=(), amount=1):
+        """Bump a counter; ``labels`` is a tuple of (name, value) pairs."""
+        key = (name, tuple(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def render(self, gauges=()):
+        lines = [
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (method, route), histogram in sorted(self.latency.items()):
+                labels = 'method="%s",route="%s"' % (method, route)
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(
+                        'http_request_duration_seconds_bucket{%s,le="%s"} %d'
+                        % (labels, bound, count))
+                lines.append(
+                    'http_request_duration_seconds_bucket{%s,le="+Inf"} %d'
+                    % (labels, histogram.count))
+                lines.append('http_request_duration_seconds_sum{%s} %f'
+                             % (labels, histogram.sum))
+                lines.append('http_request_duration_seconds_count{%s} %d'
+                             % (labels, histogram.count))
+            lines.append('# TYPE db_queries_total counter')
+            for (method, route), count in sorted(self.db_queries.items()):
+                lines.append('db_queries_total{method="%s",route="%s"} %d'
+                             % (method, route, count))
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append('%s%s %s' % (name, _labels(labels), value))
+        for name, value in gauges:
+            lines.append('%s %s' % (name, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % pair for pair in labels) + '}'
+
+
+def setup_metrics(app, gauges=None):
+    """Time every request, add Server-Timing and serve /metrics.
+
+    ``gauges`` is an optional callable returning (name, value) pairs that
+    are appended to the /metrics output, e.g. cache hit counters.
+    """
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        g.timings = {}
+        g.db_queries = 0
+        g.db_time = 0.0
+
+    @app.after_request
+    def record_timing(response):
+        if 'request_start' not in g:
+            return response
+        total = time.perf_counter() - g.request_start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe(request.method, route, total, g.db_queries)
+        if app.config['SERVER_TIMING']:
+            timings = ['%s;dur=%.2f' % (name, seconds * 1000)
+                       for name, seconds in g.timings.items()]
+            timings.append('db;dur=%.2f;desc="%d queries"'
+                           % (g.db_time * 1000, g.db_queries))
+            timings.append('total;dur=%.2f' % (total * 1000))
+            response.headers['Server-Timing'] = ', '.join(timings)
+        return response
+
+    @app.route('/metrics')
+    def get_metrics():
+        extra = gauges() if gauges is not None else ()
+        return Response(metrics.render(extra),
+                        mimetype='text/plain; version=0.0.4')
+
+    return metrics
@@ -0,0 +1,35 @@
+"""movie_actors cast association
+
+Revision ID: 2b9e5d0c7f44
+Revises: c47d2e8f1a93
+Create Date: 2026-10-18 18:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b9e5d0c7f44'
+down_revision = 'c47d2e8f1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'movie_actors',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['actor_id'], ['actors.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['movie_id'], ['movies.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('movie_id', 'actor_id')
+    )
+    op.create_index('ix_movie_actors_actor_id', 'movie_actors', ['actor_id'])
+
+
+def downgrade():
+    op.drop_index('ix_movie_actors_actor_id', table_name='movie_actors')
+    op.drop_table('movie_actors')
@@ -0,0 +1,45 @@
+"""updated_at columns and delete tombstones
+
+Revision ID: 7d4a1f9c2e65
+Revises: 2b9e5d0c7f44
+Create Date: 2026-10-18 19:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d4a1f9c2e65'
+down_revision = '2b9e5d0c7f44'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ['actors', 'movies']:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(),
+                                       nullable=True))
+        # existing rows count as changed now, the app writes UTC
+        op.execute("UPDATE %s SET updated_at = now() at time zone 'utc'"
+                   % table)
+        op.create_index('ix_%s_updated_at' % table, table, ['updated_at'])
+    op.create_table(
+        'tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('row_id', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstones_table_name_deleted_at', 'tombstones',
+                    ['table_name', 'deleted_at'])
+
+
+def downgrade():
+    op.drop_index('ix_tombstones_table_name_deleted_at',
+                  table_name='tombstones')
+    op.drop_table('tombstones')
+    for table in ['actors', 'movies']:
+        op.drop_index('ix_%s_updated_at' % table, table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,31 @@
+"""indexes for the list endpoint filters
+
+Revision ID: 8e3f9b6a4c27
+Revises: 5a1c0e7d2b11
+Create Date: 2026-10-18 18:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3f9b6a4c27'
+down_revision = '5a1c0e7d2b11'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_actors_age', 'actors', ['age'])
+    op.create_index('ix_actors_gender', 'actors', ['gender'])
+    op.create_index('ix_movies_release_date', 'movies', ['release_date'])
+    op.create_index('ix_movies_title_prefix', 'movies', ['title'],
+                    postgresql_ops={'title': 'text_pattern_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_movies_title_prefix', table_name='movies')
+    op.drop_index('ix_movies_release_date', table_name='movies')
+    op.drop_index('ix_actors_gender', table_name='actors')
+    op.drop_index('ix_actors_age', table_name='actors')
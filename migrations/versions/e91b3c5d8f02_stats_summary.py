@@ -0,0 +1,32 @@
+"""stats_summary table behind /stats
+
+Revision ID: e91b3c5d8f02
+Revises: 7d4a1f9c2e65
+Create Date: 2026-10-18 19:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91b3c5d8f02'
+down_revision = '7d4a1f9c2e65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'stats_summary',
+        sa.Column('stat', sa.String(), nullable=False),
+        sa.Column('dimension', sa.String(), nullable=False),
+        sa.Column('bucket', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('stat', 'dimension', 'bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('stats_summary')
@@ -0,0 +1,87 @@
+import base64
+import binascii
+from datetime import date, datetime, timezone
+
+from flask import abort, request
+
+
+# Query string parsing
+#
+# ``args`` defaults to flask's request.args; the ASGI app passes its own
+# query params.
+
+def int_arg(name, default=None, args=None):
+    value = (request.args if args is None else args).get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        abort(400)
+
+
+def date_arg(name, default=None, args=None):
+    value = (request.args if args is None else args).get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400)
+
+
+def datetime_arg(name, default=None, args=None):
+    """ISO 8601 timestamp as naive UTC; a trailing Z or offset is applied."""
+    value = (request.args if args is None else args).get(name)
+    if value is None or value == '':
+        return default
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        abort(400)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+# Keyset pagination
+
+def encode_cursor(last_id):
+    raw = str(last_id).encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError, binascii.Error):
+        abort(400)
+
+
+def page_args(default_size, max_size, args=None):
+    """Return ``(after_id, limit)`` from the ``cursor``/``limit`` params."""
+    args = request.args if args is None else args
+    limit = int_arg('limit', default_size, args)
+    if limit < 1:
+        abort(400)
+    cursor = args.get('cursor')
+    after_id = decode_cursor(cursor) if cursor else None
+    return after_id, min(limit, max_size)
+
+
+def keyset_page(query, id_column, after_id, limit):
+    """Fetch one page ordered by ``id_column``.
+
+    Returns the rows and the cursor for the next page, or None when this is
+    the last page. One extra row is read to find out whether there is more.
+    """
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+    return rows, next_cursor
@@ -0,0 +1,151 @@
+import itertools
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import create_engine, event
+
+from db_pool import engine_options, pool_stats
+from response_cache import MemoryBackend, make_backend
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+# Replicas
+
+class ReplicaSet:
+    """Read replica engines handed out round-robin.
+
+    A replica is probed with ``SELECT 1`` at most once every
+    ``check_interval`` seconds and skipped while the probe fails. A
+    connection lost mid-query marks it down until the next probe.
+    """
+
+    def __init__(self, engines, check_interval=5, clock=time.monotonic):
+        self.engines = engines
+        self.check_interval = check_interval
+        self.clock = clock
+        self._healthy = [True] * len(engines)
+        self._checked_at = [None] * len(engines)
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        for index, engine in enumerate(engines):
+            event.listen(engine, 'handle_error', self._on_error(index))
+
+    def choose(self):
+        """The next healthy replica, or None when all of them are down."""
+        for _ in range(len(self.engines)):
+            with self._lock:
+                index = next(self._next) % len(self.engines)
+            if self._is_healthy(index):
+                return self.engines[index]
+        return None
+
+    def stats(self):
+        return [dict(pool_stats(engine), healthy=healthy)
+                for engine, healthy in zip(self.engines, self._healthy)]
+
+    def _is_healthy(self, index):
+        now = self.clock()
+        checked_at = self._checked_at[index]
+        if checked_at is None or now - checked_at >= self.check_interval:
+            self._checked_at[index] = now
+            self._healthy[index] = self._probe(self.engines[index])
+        return self._healthy[index]
+
+    def _probe(self, engine):
+        try:
+            with engine.connect() as conn:
+                conn.execute('SELECT 1')
+            return True
+        except Exception:
+            # repr() masks the password, str() would print it
+            print('replica %r failed its health check' % engine.url)
+            return False
+
+    def _on_error(self, index):
+        def mark_down(context):
+            if context.is_disconnect:
+                self._healthy[index] = False
+        return mark_down
+
+
+class RecentWriters:
+    """Remembers which callers wrote in the last ``window`` seconds."""
+
+    def __init__(self, backend, window=5):
+        self.backend = backend
+        self.window = window
+
+    def add(self, sub):
+        self.backend.set('wrote:' + sub, b'1', self.window)
+
+    def __contains__(self, sub):
+        return self.backend.get('wrote:' + sub) is not None
+
+
+# Routing
+
+class ReadRouter:
+    """Picks the engine the queries of the current request run on.
+
+    Reads (GET/HEAD) go to a replica unless the caller wrote within the
+    read-your-writes window; everything else stays on the primary.
+    """
+
+    def __init__(self, replicas, writers):
+        self.replicas = replicas
+        self.writers = writers
+
+    def route(self, payload):
+        """Called once the caller is authenticated; sets ``g.read_bind``
+        (None means the primary) and ``g.fresh_reads``."""
+        sub = payload.get('sub')
+        g.auth_sub = sub
+        g.fresh_reads = sub is not None and sub in self.writers
+        if request.method in READ_METHODS and not g.fresh_reads:
+            g.read_bind = self.replicas.choose()
+        else:
+            g.read_bind = None
+
+
+def replica_engine_options(config, url):
+    """engine_options() plus a connect timeout, so that a replica which
+    drops packets fails its probe in REPLICA_CONNECT_TIMEOUT seconds
+    instead of stalling the request for the OS TCP timeout."""
+    options = engine_options(config, url)
+    if options:
+        options.setdefault('connect_args', {})['connect_timeout'] = \
+            config['REPLICA_CONNECT_TIMEOUT']
+    return options
+
+
+def setup_replicas(app):
+    """Route reads to DATABASE_REPLICA_URLS; None when there are none.
+
+    The read-your-writes markers live in the RESPONSE_CACHE_BACKEND store
+    so that with redis they hold across workers; otherwise each worker
+    keeps its own.
+    """
+    urls = app.config['DATABASE_REPLICA_URLS']
+    if not urls:
+        return None
+    replicas = ReplicaSet(
+        [create_engine(url, **replica_engine_options(app.config, url))
+         for url in urls],
+        check_interval=app.config['REPLICA_CHECK_INTERVAL'])
+    backend = make_backend(app.config['RESPONSE_CACHE_BACKEND'],
+                           app.config['RESPONSE_CACHE_URL'], size=4096)
+    writers = RecentWriters(backend or MemoryBackend(4096),
+                            app.config['READ_YOUR_WRITES_WINDOW'])
+    router = ReadRouter(replicas, writers)
+    app.extensions['replicas'] = router
+
+    @app.after_request
+    def remember_writer(response):
+        if request.method not in READ_METHODS and \
+                response.status_code < 400 and g.get('auth_sub'):
+            writers.add(g.auth_sub)
+        return response
+
+    return router
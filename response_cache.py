@@ -0,0 +1,203 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, g, request
+
+from compression import COMPRESSIBLE
+
+
+# Backends
+
+class MemoryBackend:
+    """Per-process LRU, the default backend.
+
+    Counters kept with ``incr`` live outside the LRU so that they are
+    never evicted.
+    """
+
+    def __init__(self, maxsize=512, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self.clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = self.clock() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+class RedisBackend:
+    """Store shared by every gunicorn worker.
+
+    ``client`` is anything with the redis-py ``get``/``set``/``incr`` API;
+    tests pass a local stand-in instead of a server connection.
+    """
+
+    def __init__(self, client, prefix='capstone:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+
+def make_backend(kind, url=None, size=512):
+    """Build a ``'memory'`` or ``'redis'`` backend; ``'none'`` gives None."""
+    if kind == 'none':
+        return None
+    if kind == 'redis':
+        return RedisBackend.from_url(url)
+    return MemoryBackend(size)
+
+
+# Response cache
+
+class ResponseCache:
+    """Caches serialized GET responses with a strong ETag.
+
+    Entries are keyed by endpoint, query string, the caller's permission
+    set and the generation number of every table the body is built from.
+    A committed write to a table bumps its generation, which orphans every
+    entry built from it.
+
+    Bodies read from a replica (``g.read_bind``) may lag the primary, so
+    they are only kept for ``replica_ttl`` seconds, and callers inside their
+    read-your-writes window (``g.fresh_reads``) skip the lookup.
+
+    With a ``compressor`` each encoding of a body is cached next to it
+    under ``key:encoding`` with its own ETag, so a hit is sent without
+    compressing it again.
+    """
+
+    def __init__(self, backend, ttl=300, replica_ttl=None, compressor=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.replica_ttl = replica_ttl
+        self.compressor = compressor
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, table):
+        if self.backend is not None:
+            self.backend.incr('gen:' + table)
+
+    def cached(self, *tables):
+        """Cache a GET handler whose body is built from ``tables``."""
+        def decorator(f):
+            if self.backend is None:
+                return f
+
+            @wraps(f)
+            def wrapper(payload, *args, **kwargs):
+                key = self._key(tables, payload)
+                lookup = not g.get('fresh_reads')
+                encoding = None
+                if self.compressor is not None:
+                    encoding = self.compressor.accepted()
+                if lookup and encoding is not None:
+                    entry = self.backend.get(key + ':' + encoding)
+                    if entry is not None:
+                        self.hits += 1
+                        return self._respond(entry, encoding)
+                entry = self.backend.get(key) if lookup else None
+                if entry is None:
+                    self.misses += 1
+                    response = f(payload, *args, **kwargs)
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    body = response.get_data()
+                    entry = self._entry(hashlib.sha256(body).hexdigest(),
+                                        response.mimetype, body)
+                    self.backend.set(key, entry, self._ttl())
+                else:
+                    self.hits += 1
+                etag, mimetype, body = entry.split(b'\n', 2)
+                if encoding is not None and \
+                        mimetype.decode() in COMPRESSIBLE and \
+                        len(body) >= self.compressor.min_size:
+                    entry = self._entry(
+                        etag.decode() + '-' + encoding, mimetype.decode(),
+                        self.compressor.compress(body, encoding))
+                    self.backend.set(key + ':' + encoding, entry,
+                                     self._ttl())
+                    return self._respond(entry, encoding)
+                return self._respond(entry)
+            return wrapper
+        return decorator
+
+    def _key(self, tables, payload):
+        generations = []
+        for table in tables:
+            generation = self.backend.get('gen:' + table) or 0
+            if isinstance(generation, bytes):
+                generation = generation.decode()
+            generations.append(str(generation))
+        raw = json.dumps([
+            request.endpoint,
+            sorted(request.args.items(multi=True)),
+            sorted(payload.get('permissions', [])),
+            generations
+        ])
+        return 'resp:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _ttl(self):
+        if g.get('read_bind') is not None and self.replica_ttl:
+            return min(self.ttl, self.replica_ttl)
+        return self.ttl
+
+    def _entry(self, etag, mimetype, body):
+        return b'\n'.join([etag.encode(), mimetype.encode(), body])
+
+    def _respond(self, entry, encoding=None):
+        etag, mimetype, body = entry.split(b'\n', 2)
+        etag = etag.decode()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=mimetype.decode())
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        if self.compressor is not None:
+            response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,74 @@
+import json
+from datetime import date
+
+from flask import Response, jsonify
+from flask.json import JSONEncoder as FlaskJSONEncoder
+
+from metrics import span
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON encoding
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """Encoder for jsonify that writes dates as ISO 8601, like dumps."""
+
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return super().default(o)
+
+
+_stdlib_encode = json.JSONEncoder(
+    default=_default, separators=(',', ':')).encode
+
+
+def dumps(obj):
+    """Encode to UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return _stdlib_encode(obj).encode('utf-8')
+
+
+def json_response(obj, status=200):
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+
+def list_response(key, rows, next_cursor, fast=True, related=None,
+                  extra=None):
+    """Serialize one page of a list endpoint.
+
+    With ``fast`` the rows are column tuples from ``with_entities`` and are
+    encoded straight to bytes; otherwise they are model instances going
+    through ``Model.format()`` and ``jsonify``.
+
+    ``related`` is an optional ``(field, loader)`` pair. The loader gets the
+    ids of the whole page and returns ``{id: [dicts]}``, so related rows
+    cost one query per page however many rows it holds. ``extra`` holds
+    more top-level fields of the body.
+    """
+    if fast:
+        items = [row._asdict() for row in rows]
+    else:
+        items = [row.format() for row in rows]
+    if related is not None:
+        field, loader = related
+        linked = loader([item['id'] for item in items])
+        for item in items:
+            item[field] = linked[item['id']]
+    with span('encode'):
+        body = {key: items, 'next_cursor': next_cursor}
+        body.update(extra or {})
+        if fast:
+            return json_response(body)
+        return jsonify(body)
@@ -0,0 +1,147 @@
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import exc, extract, func
+
+from models import db, stats_summary, Actors, Movies
+
+
+# Aggregates
+#
+# Each stat is a function yielding (dimension, bucket, count) rows, computed
+# with GROUP BY queries that postgres can answer from the column indexes.
+
+def _label(value):
+    return 'unknown' if value is None else str(value)
+
+
+def actor_counts(age_bucket=10):
+    yield 'total', '', db.session.query(func.count(Actors.id)).scalar()
+    for gender, count in db.session.query(
+            Actors.gender, func.count(Actors.id)).group_by(Actors.gender):
+        yield 'gender', _label(gender), count
+    low = (Actors.age / age_bucket) * age_bucket
+    for start, count in db.session.query(
+            low, func.count(Actors.id)).group_by(low):
+        bucket = 'unknown' if start is None else '%d-%d' % (
+            start, start + age_bucket - 1)
+        yield 'age', bucket, count
+
+
+def movie_counts(age_bucket=10):
+    yield 'total', '', db.session.query(func.count(Movies.id)).scalar()
+    year = extract('year', Movies.release_date)
+    for value, count in db.session.query(
+            year, func.count(Movies.id)).group_by(year):
+        yield 'release_year', _label(
+            None if value is None else int(value)), count
+
+
+STATS = {
+    'actors': actor_counts,
+    'movies': movie_counts
+}
+
+
+# Summary table
+
+def refresh_stats(stat, age_bucket=10):
+    """Recompute the summary rows of ``stat`` in one transaction and
+    return them.
+
+    On postgres concurrent refreshes of a stat queue on an advisory lock,
+    so each DELETE sees the rows the one before it committed. Elsewhere a
+    refresh that loses the race on the primary key is rolled back: the
+    rows the other one wrote are as good.
+    """
+    primary = db.get_engine()
+    if primary.dialect.name == 'postgresql':
+        # on the primary, where the DELETE and INSERT run, even when the
+        # counts are read from a replica
+        db.session.execute(
+            'SELECT pg_advisory_xact_lock(hashtext(:key))',
+            {'key': 'stats_summary:' + stat}, bind=primary)
+    now = datetime.utcnow()
+    rows = [{'stat': stat, 'dimension': dimension, 'bucket': bucket,
+             'count': count, 'refreshed_at': now}
+            for dimension, bucket, count in STATS[stat](age_bucket)]
+    try:
+        db.session.execute(stats_summary.delete().where(
+            stats_summary.c.stat == stat))
+        db.session.execute(stats_summary.insert(), rows)
+        db.session.commit()
+    except exc.IntegrityError:
+        db.session.rollback()
+    return rows
+
+
+class StatsRefresher:
+    """Refreshes stale summaries on a background thread, off the request
+    path. At most one refresh per stat runs at a time in a process."""
+
+    def __init__(self, app):
+        self.app = app
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def request(self, stat):
+        """Start a refresh of ``stat`` unless one is already running."""
+        with self._lock:
+            if stat in self._threads:
+                return False
+            thread = threading.Thread(target=self._run, args=(stat,),
+                                      daemon=True)
+            self._threads[stat] = thread
+        thread.start()
+        return True
+
+    def wait(self):
+        """Block until the refreshes that are running have finished."""
+        with self._lock:
+            threads = list(self._threads.values())
+        for thread in threads:
+            thread.join()
+
+    def _run(self, stat):
+        try:
+            with self.app.app_context():
+                try:
+                    refresh_stats(stat, self.app.config['STATS_AGE_BUCKET'])
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                del self._threads[stat]
+
+
+def read_stats(stat, max_age, refresher, age_bucket=10):
+    """``(counts, refreshed_at)`` of ``stat`` from the summary table.
+
+    This reads a few dozen rows whatever the size of the tables. A
+    summary older than ``max_age`` seconds is still served, while
+    ``refresher`` recomputes it in the background; only a missing summary
+    is computed before answering.
+    """
+    rows = [row._asdict() for row in _summary(stat)]
+    if not rows:
+        # use what was computed, a replica may not have the new rows yet
+        rows = refresh_stats(stat, age_bucket)
+    elif rows[0]['refreshed_at'] < \
+            datetime.utcnow() - timedelta(seconds=max_age):
+        refresher.request(stat)
+    counts = {}
+    for row in rows:
+        if row['dimension'] == 'total':
+            counts['total'] = row['count']
+        else:
+            counts.setdefault(row['dimension'], {})[row['bucket']] = \
+                row['count']
+    return counts, rows[0]['refreshed_at']
+
+
+def _summary(stat):
+    table = stats_summary
+    return db.session.query(
+        table.c.dimension, table.c.bucket, table.c.count,
+        table.c.refreshed_at).filter(table.c.stat == stat).order_by(
+            table.c.dimension, table.c.bucket).all()
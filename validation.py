@@ -0,0 +1,67 @@
+from datetime import date
+
+
+# Request body validation shared by the single-item and batch handlers
+
+ACTOR_FIELDS = ('name', 'age', 'gender')
+MOVIE_FIELDS = ('title', 'release_date')
+
+
+def _blank(value):
+    return value is None or value == '' or value == 0
+
+
+def _text(value):
+    if not isinstance(value, str):
+        raise TypeError(value)
+    return value
+
+
+def _integer(value):
+    # int() would take True as 1 and truncate 3.9 to 3
+    if isinstance(value, bool) or \
+            isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    return int(value)
+
+
+def _clean(item, fields, converters, partial):
+    if not isinstance(item, dict):
+        return {}, ['item must be a JSON object']
+    values = {}
+    errors = []
+    for field in fields:
+        if field not in item:
+            if not partial:
+                errors.append(field + ' is required')
+            continue
+        value = item[field]
+        if _blank(value):
+            errors.append(field + ' must not be blank')
+            continue
+        convert = converters.get(field)
+        if convert is not None:
+            try:
+                value = convert(value)
+            except (TypeError, ValueError):
+                errors.append(field + ' is invalid')
+                continue
+        values[field] = value
+    return values, errors
+
+
+def clean_actor(item, partial=False):
+    """Return ``(values, errors)`` for an actor body.
+
+    ``values`` only holds the model fields, converted to column types.
+    With ``partial`` missing fields are allowed, as for PATCH bodies.
+    """
+    return _clean(item, ACTOR_FIELDS,
+                  {'name': _text, 'age': _integer, 'gender': _text}, partial)
+
+
+def clean_movie(item, partial=False):
+    """Return ``(values, errors)`` for a movie body, see clean_actor."""
+    return _clean(item, MOVIE_FIELDS,
+                  {'title': _text, 'release_date': date.fromisoformat},
+                  partial)